@@ -0,0 +1,58 @@
+"""Benchmark the median kernels that collapse the arrays of Remedian.
+
+Run with ``python benchmarks/bench_kernels.py``. For each combination of
+``obs_size``, ``n_obs`` and array layout, the time of one collapse is reported
+for :func:`numpy.median` and for each kernel in ``remedian._kernels``,
+together with the speedup of the kernel that ``kernel='auto'`` picks. The
+thresholds of this choice in ``remedian._kernels`` are based on this table.
+"""
+
+# License: MIT
+
+from timeit import default_timer as timer
+
+import numpy as np
+
+from remedian._kernels import KERNELS, get_kernel
+
+OBS_SIZES = [(1,), (8, 8), (16, 16), (32, 32), (64, 64), (256, 256)]
+N_OBSES = [3, 5, 7, 9, 15, 25, 51]
+N_REPEATS = 5
+
+
+def time_kernel(kernel, data, axis):
+    """Return the best time of collapsing `data` with `kernel`."""
+    best = np.inf
+    for _ in range(N_REPEATS):
+        scratch = data.copy()
+        start = timer()
+        kernel(scratch, axis)
+        best = min(best, timer() - start)
+    return best
+
+
+def main():
+    """Print a table of collapse times in milliseconds."""
+    names = sorted(KERNELS)
+    print(f'{"obs_size":>12} {"n_obs":>6} {"layout":>7} ' +
+          ' '.join(f'{name:>10}' for name in names) + f' {"auto":>10}')
+    for obs_size in OBS_SIZES:
+        for n_obs in N_OBSES:
+            for layout, axis in (('last', -1), ('first', 0)):
+                shape = obs_size + (n_obs,) if axis == -1 else \
+                    (n_obs,) + obs_size
+                data = np.random.random(shape)
+                times = {name: time_kernel(KERNELS[name], data, axis)
+                         for name in names}
+                kernel = get_kernel('auto', n_obs, layout,
+                                    int(np.prod(obs_size)))
+                auto = time_kernel(kernel, data, axis)
+                speedup = times['numpy'] / auto
+                print(f'{str(obs_size):>12} {n_obs:>6} {layout:>7} ' +
+                      ' '.join(f'{times[name] * 1e3:>10.3f}'
+                               for name in names) +
+                      f' {speedup:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
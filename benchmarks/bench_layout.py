@@ -0,0 +1,59 @@
+"""Benchmark the two array layouts of Remedian.
+
+Run with ``python benchmarks/bench_layout.py``. For each combination of
+``obs_size`` and ``n_obs``, two numbers are reported for ``layout='last'``
+and ``layout='first'``:
+
+- the throughput of :meth:`remedian.Remedian.add_obs` in observations per
+  second while the first array is filled (no collapse happens)
+- the time it takes to collapse a full first array into its median
+"""
+
+# License: MIT
+
+from timeit import default_timer as timer
+
+import numpy as np
+
+from remedian import Remedian
+
+OBS_SIZES = [(32, 32), (128, 128), (512, 512)]
+N_OBSES = [5, 25, 101]
+N_REPEATS = 3
+
+
+def time_layout(obs_size, n_obs, layout):
+    """Return the best fill throughput and collapse time over repetitions."""
+    # t is large enough so that the first array collapses exactly once
+    t = n_obs + 1
+    data = np.random.random((n_obs,) + obs_size)
+    best_fill = np.inf
+    best_collapse = np.inf
+    for _ in range(N_REPEATS):
+        rem = Remedian(obs_size, n_obs, t, layout=layout)
+        start = timer()
+        for obs in data[:-1]:
+            rem.add_obs(obs)
+        best_fill = min(best_fill, timer() - start)
+
+        # The last observation fills the first array and triggers a collapse
+        start = timer()
+        rem.add_obs(data[-1])
+        best_collapse = min(best_collapse, timer() - start)
+    return (n_obs - 1) / best_fill, best_collapse
+
+
+def main():
+    """Print a table comparing both layouts."""
+    print(f'{"obs_size":>12} {"n_obs":>6} {"layout":>7} {"fill [obs/s]":>14} '
+          f'{"collapse [ms]":>14}')
+    for obs_size in OBS_SIZES:
+        for n_obs in N_OBSES:
+            for layout in ('last', 'first'):
+                fill, collapse = time_layout(obs_size, n_obs, layout)
+                print(f'{str(obs_size):>12} {n_obs:>6} {layout:>7} '
+                      f'{fill:>14.1f} {collapse * 1e3:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
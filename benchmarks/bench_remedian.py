@@ -0,0 +1,191 @@
+"""Benchmark suite for the throughput, latency and memory of Remedian.
+
+Run with ``python benchmarks/bench_remedian.py --out results.json``. For each
+combination of the parameters in ``PARAMS``, the following is measured:
+
+- ``obs_per_sec``: observations per second of :meth:`remedian.Remedian.add_obs`
+  over all ``t`` observations, including all collapses
+- ``collapse_ms``: mean duration of a collapse of each array in milliseconds
+- ``final_ms``: duration of computing the remedian from all arrays after the
+  last collapse in milliseconds
+- ``peak_bytes``: peak memory allocated from creating the Remedian until the
+  remedian is computed, as measured by :mod:`tracemalloc`
+
+The results are written as a JSON list with one entry per combination. Pass
+``--compare old_results.json`` to print all measures that got worse by more
+than ``--tolerance`` compared to a previous run, for example of the last
+release. The exit code is 1 if there are any.
+"""
+
+# License: MIT
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import tracemalloc
+from timeit import default_timer as timer
+
+import numpy as np
+
+import remedian
+from remedian import Remedian
+
+PARAMS = {
+    'obs_size': [(1,), (64, 64), (256, 256)],
+    'n_obs': [3, 9, 51],
+    't': [100, 1000],
+    'dtype': ['float64', 'float32', 'uint8'],
+}
+
+# Parameters of a quick run, for example to check that the suite works
+QUICK_PARAMS = {
+    'obs_size': [(1,), (32, 32)],
+    'n_obs': [3, 9],
+    't': [100],
+    'dtype': ['float64'],
+}
+
+# Measures for which smaller is better, and the ones for which larger is
+MEASURES_SMALLER = ['collapse_ms', 'final_ms', 'peak_bytes']
+MEASURES_LARGER = ['obs_per_sec']
+
+
+def make_data(obs_size, n_samples, dtype, rng):
+    """Make random observations of the given data type."""
+    data = rng.random((n_samples,) + tuple(obs_size)) * 255
+    return data.astype(dtype)
+
+
+def ingest(obs_size, n_obs, t, dtype, data, instrument=False):
+    """Add `t` observations cycling through `data` to a new Remedian."""
+    rem = Remedian(obs_size, n_obs, t, dtype=dtype, instrument=instrument)
+    for obs_i in range(t):
+        rem.add_obs(data[obs_i % len(data)])
+    return rem
+
+
+def run_case(obs_size, n_obs, t, dtype, rng):
+    """Measure all quantities for one combination of parameters."""
+    # Cycle through a few observations to not measure the data generation
+    data = make_data(obs_size, min(t, 16), dtype, rng)
+
+    start = timer()
+    rem = ingest(obs_size, n_obs, t, dtype, data)
+    obs_per_sec = t / (timer() - start)
+
+    # The remedian is computed with the estimate method after the last
+    # collapse, time it again on its own
+    start = timer()
+    rem.estimate()
+    final_ms = (timer() - start) * 1e3
+
+    # The instrumentation times each collapse, so it gets its own run
+    stats = ingest(obs_size, n_obs, t, dtype, data, instrument=True).stats
+    collapse_ms = [None] * rem.k_arrs
+    for arr_i, (count, time) in enumerate(zip(stats['collapse_count'],
+                                              stats['collapse_time'])):
+        if count:
+            collapse_ms[arr_i] = time / count * 1e3
+
+    # Tracing memory slows everything down, so it gets its own run
+    tracemalloc.start()
+    ingest(obs_size, n_obs, t, dtype, data)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'obs_per_sec': obs_per_sec,
+        'collapse_ms': collapse_ms,
+        'final_ms': final_ms,
+        'peak_bytes': peak_bytes,
+    }
+
+
+def run(params, n_repeats):
+    """Run all combinations of parameters and keep the best of repeats."""
+    rng = np.random.default_rng(42)
+    results = []
+    for values in itertools.product(*params.values()):
+        case = dict(zip(params.keys(), values))
+        runs = [run_case(**case, rng=rng) for _ in range(n_repeats)]
+        best = {
+            'obs_per_sec': max(run['obs_per_sec'] for run in runs),
+            'collapse_ms': [None if None in times else min(times) for times
+                            in zip(*(run['collapse_ms'] for run in runs))],
+            'final_ms': min(run['final_ms'] for run in runs),
+            'peak_bytes': min(run['peak_bytes'] for run in runs),
+        }
+        case['obs_size'] = list(case['obs_size'])
+        results.append({**case, **best})
+        print(f'{case}: {best["obs_per_sec"]:.1f} obs/s, '
+              f'final {best["final_ms"]:.3f} ms, '
+              f'peak {best["peak_bytes"] / 2**20:.2f} MiB', file=sys.stderr)
+    return results
+
+
+def compare(results, old_results, tolerance):
+    """Get all measures that got worse than in `old_results`."""
+    def key(result):
+        return tuple(str(result[param]) for param in PARAMS)
+
+    old_by_key = {key(result): result for result in old_results}
+    regressions = []
+    for result in results:
+        old = old_by_key.get(key(result))
+        if old is None:
+            continue
+        for measure in MEASURES_SMALLER + MEASURES_LARGER:
+            # None becomes NaN, which is never worse
+            new_values = np.atleast_1d(np.array(result[measure], dtype=float))
+            old_values = np.atleast_1d(np.array(old[measure], dtype=float))
+            if new_values.shape != old_values.shape:
+                continue
+            if measure in MEASURES_SMALLER:
+                worse = new_values > old_values * (1 + tolerance)
+            else:
+                worse = new_values < old_values / (1 + tolerance)
+            if np.any(worse):
+                regressions.append(
+                    f'{key(result)} {measure}: {old[measure]} -> '
+                    f'{result[measure]}')
+    return regressions
+
+
+def main(argv=None):
+    """Run the benchmark suite."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='JSON file of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative change that counts as a regression')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='number of repeats of each case')
+    parser.add_argument('--quick', action='store_true',
+                        help='run only a few small cases')
+    args = parser.parse_args(argv)
+
+    results = run(QUICK_PARAMS if args.quick else PARAMS, args.repeats)
+    if args.out:
+        with open(args.out, 'w') as fout:
+            json.dump({
+                'remedian_version': remedian.__version__,
+                'numpy_version': np.__version__,
+                'python_version': platform.python_version(),
+                'machine': platform.machine(),
+                'results': results,
+            }, fout, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fin:
+            old_results = json.load(fin)['results']
+        regressions = compare(results, old_results, args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
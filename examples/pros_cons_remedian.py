@@ -5,8 +5,9 @@ Pros and Cons of Remedian
 
 .. currentmodule:: remedian
 
-In this example we test :class:`remedian.Remedian` against :func:`numpy.median`
-in terms of three parameters:
+In this example we test :class:`remedian.Remedian` (via
+:func:`remedian.compute_remedian`) against :func:`numpy.median` in terms of
+three parameters:
 
 - computation time
 - mean squared error compared to true median
@@ -24,7 +25,7 @@ from timeit import default_timer as timer
 import matplotlib.pyplot as plt
 import numpy as np
 
-from remedian import Remedian
+from remedian import compute_remedian
 
 ###############################################################################
 # We start by generating two datasets that we want to compute the median of
@@ -64,22 +65,17 @@ for idata, data in enumerate(datas):
     for in_obs, n_obs in enumerate(n_obses):
 
         start = timer()
-        # New Remedian object
-        rem = Remedian(data_shape[:-1], n_obs, n)
-
-        # calculate the remedian
-        for data_idx in range(n):
-            rem.add_obs(data[..., data_idx])
-
-        approx_median = rem.remedian
+        # calculate the remedian. This is the same as adding each observation
+        # to a new Remedian object one after another
+        approx_median = compute_remedian(data, n_obs, axis=-1)
         end = timer()
 
         # Time elapsed in seconds
         compute_times[idata, in_obs] = end - start
 
         # Memory needed in bytes
-        memory_needed[idata, in_obs] = n_obs * (data[..., data_idx].size *
-                                                data[..., data_idx].itemsize)
+        memory_needed[idata, in_obs] = n_obs * (data[..., 0].size *
+                                                data[..., 0].itemsize)
 
         # mean square error from true median
         mses[idata, in_obs] = np.mean((approx_median-median)**2)
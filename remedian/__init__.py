@@ -2,4 +2,7 @@
 
 __version__ = '0.2.dev0'
 
-from remedian.remedian import Remedian  # noqa: F401
+from remedian.bank import RemedianBank  # noqa: F401
+from remedian.remedian import Remedian, compute_remedian  # noqa: F401
+from remedian.scalar import ScalarRemedian  # noqa: F401
+from remedian.window import WindowedRemedian  # noqa: F401
@@ -0,0 +1,160 @@
+"""Compute the remedian of observations in ``.npy`` files.
+
+Run with ``python -m remedian``, see ``python -m remedian --help``. All files
+are memory-mapped and read in blocks by a background thread, while the
+previous block is added to a :class:`remedian.Remedian`.
+"""
+
+# License: MIT
+
+import argparse
+import glob
+import os
+import queue
+import sys
+import threading
+from timeit import default_timer as timer
+
+import numpy as np
+
+from remedian.remedian import Remedian
+
+# Marks the end of the blocks in the queue of the reader thread
+_DONE = object()
+
+
+def expand_inputs(inputs):
+    """Expand glob patterns and directories into a list of ``.npy`` files."""
+    fnames = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*.npy')
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise FileNotFoundError(f'No files found for: {pattern}')
+        fnames.extend(matches)
+    return fnames
+
+
+def iter_blocks(arrs, axis, block_bytes):
+    """Yield blocks of observations stacked along the last axis.
+
+    Parameters
+    ----------
+    arrs : list of ndarray
+        The memory-mapped arrays.
+    axis : None | int
+        The axis along which the observations are stacked in each array, or
+        None if each array is a single observation.
+    block_bytes : int
+        The approximate number of bytes of each block.
+
+    """
+    obs_bytes = max(1, arrs[0].nbytes if axis is None else
+                    np.take(arrs[0], 0, axis=axis).nbytes)
+    block_size = max(1, block_bytes // obs_bytes)
+    if axis is None:
+        for start in range(0, len(arrs), block_size):
+            # Stacking reads the data from disk
+            yield np.stack(arrs[start:start+block_size], axis=-1)
+        return
+    for arr in arrs:
+        arr = np.moveaxis(arr, axis, -1)
+        for start in range(0, arr.shape[-1], block_size):
+            yield np.array(arr[..., start:start+block_size])
+
+
+def prefetch(blocks, n_prefetch):
+    """Read the blocks on a background thread, `n_prefetch` in advance."""
+    blocks_queue = queue.Queue(maxsize=n_prefetch)
+    stop = threading.Event()
+
+    def read():
+        try:
+            for block in blocks:
+                if stop.is_set():
+                    return
+                blocks_queue.put(block)
+        except BaseException as exc:
+            blocks_queue.put(exc)
+            return
+        blocks_queue.put(_DONE)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    try:
+        while True:
+            block = blocks_queue.get()
+            if block is _DONE:
+                return
+            if isinstance(block, BaseException):
+                raise block
+            yield block
+    finally:
+        # Let the reader finish if we stop early
+        stop.set()
+        while reader.is_alive():
+            try:
+                blocks_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def main(argv=None):
+    """Compute the remedian of observations in ``.npy`` files."""
+    parser = argparse.ArgumentParser(
+        prog='python -m remedian', description=__doc__.splitlines()[0])
+    parser.add_argument('inputs', nargs='+',
+                        help='.npy files, glob patterns or directories')
+    parser.add_argument('--out', required=True,
+                        help='.npy file to write the remedian to')
+    parser.add_argument('--n-obs', type=int, nargs='+', required=True,
+                        help='number of observations of each array')
+    parser.add_argument('--axis', type=int, default=None,
+                        help='axis along which the observations are stacked '
+                        'in each file (default: each file is one observation)')
+    parser.add_argument('--quantiles', type=float, nargs='+', default=None,
+                        help='quantiles to compute instead of the median')
+    parser.add_argument('--kernel', default='auto',
+                        help='median kernel to collapse the arrays')
+    parser.add_argument('--n-jobs', type=int, default=1,
+                        help='number of threads to collapse an array')
+    parser.add_argument('--block-bytes', type=int, default=2**26,
+                        help='approximate number of bytes read at once')
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='number of blocks read in advance')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not report the throughput')
+    args = parser.parse_args(argv)
+
+    fnames = expand_inputs(args.inputs)
+    arrs = [np.load(fname, mmap_mode='r') for fname in fnames]
+    if args.axis is None:
+        obs_size = arrs[0].shape
+        t = len(arrs)
+    else:
+        obs_size = np.take(arrs[0], 0, axis=args.axis).shape
+        t = sum(arr.shape[args.axis] for arr in arrs)
+    n_obs = args.n_obs[0] if len(args.n_obs) == 1 else args.n_obs
+    rem = Remedian(obs_size, n_obs, t, dtype=arrs[0].dtype,
+                   kernel=args.kernel, n_jobs=args.n_jobs,
+                   quantiles=args.quantiles)
+
+    start = timer()
+    n_bytes = 0
+    blocks = iter_blocks(arrs, args.axis, args.block_bytes)
+    for block in prefetch(blocks, args.prefetch):
+        rem.add_obs_batch(block)
+        n_bytes += block.nbytes
+    duration = timer() - start
+    np.save(args.out, rem.remedian)
+
+    if not args.quiet:
+        print(f'{t} observations of shape {obs_size} from {len(fnames)} '
+              f'file(s) in {duration:.3f} s: {t / duration:.1f} obs/s, '
+              f'{n_bytes / 2**20 / duration:.1f} MiB/s', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,399 @@
+"""Median kernels used to collapse the arrays of a Remedian.
+
+A kernel is a function ``kernel(data, axis)`` that returns the median of
+`data` along `axis`, with the same result (including data type and NaN
+propagation) as :func:`numpy.median`. Kernels are allowed to overwrite
+`data`, because the arrays of a Remedian are re-used after each collapse.
+The kernels in ``KERNELS`` also take an ``out`` array to write the median
+into, without allocating temporary arrays where possible, see
+:func:`apply_kernel`.
+"""
+
+# License: MIT
+
+import functools
+
+import numpy as np
+
+# Arrays with up to this many observations are collapsed with a min/max
+# network, larger arrays with a partition. The network works on one whole
+# observation at a time, which is much faster if observations are contiguous
+# in memory. Each comparator is a separate ufunc call, so the network only
+# pays off for observations with at least this many elements. See
+# benchmarks/bench_kernels.py
+NETWORK_MAX_N = {'last': 11, 'first': 64}
+NETWORK_MIN_ELEMS = {'last': 1024, 'first': 256}
+
+
+def _sorting_network(n):
+    """Get the comparators of a sorting network for `n` inputs.
+
+    Uses Batcher's odd-even merge sort for the next power of two and drops all
+    comparators that touch an input >= `n`. This is valid, because these
+    inputs can be thought of as +inf, which are never moved by a comparator.
+
+    Returns a list of pairs ``(i, j)`` with ``i < j``, meaning that after the
+    comparator, input `i` holds the minimum and input `j` the maximum.
+    """
+    n_pow2 = 1
+    while n_pow2 < n:
+        n_pow2 *= 2
+
+    pairs = []
+    p = 1
+    while p < n_pow2:
+        k = p
+        while k >= 1:
+            for j in range(k % p, n_pow2 - k, 2 * k):
+                for i in range(min(k, n_pow2 - j - k)):
+                    if (i + j) // (2 * p) == (i + j + k) // (2 * p):
+                        pairs.append((i + j, i + j + k))
+            k //= 2
+        p *= 2
+    return [(i, j) for i, j in pairs if j < n]
+
+
+@functools.lru_cache(maxsize=None)
+def median_network(n):
+    """Get a min/max network that selects the middle of `n` inputs.
+
+    Starts from a sorting network and removes all comparators that do not
+    influence the middle input(s) ``(n - 1) // 2`` and ``n // 2``. Comparators
+    of which only the minimum or only the maximum is needed are kept as a
+    single operation.
+
+    Returns a tuple of ``(i, j, need_min, need_max)``.
+    """
+    needed = {(n - 1) // 2, n // 2}
+    network = []
+    for i, j in reversed(_sorting_network(n)):
+        need_min = i in needed
+        need_max = j in needed
+        if need_min or need_max:
+            network.append((i, j, need_min, need_max))
+            needed.update((i, j))
+    return tuple(reversed(network))
+
+
+def _result_dtype(dtype):
+    """Get the data type of the median of data of type `dtype`."""
+    if np.issubdtype(dtype, np.inexact):
+        return np.dtype(dtype)
+    return np.dtype(np.float64)
+
+
+def _take(data, idx, axis):
+    """Get a view of index `idx` along `axis` of `data`."""
+    # Indexing with an Ellipsis gives writeable views, also for 1D data
+    return data[(slice(None),) * (axis % data.ndim) + (idx, Ellipsis)]
+
+
+def _mean_of_middle(lo, hi, n, out=None):
+    """Get the median from the middle element(s) `lo` and `hi` of `n`.
+
+    If `out` is not None, the median is written into it.
+    """
+    res_dtype = _result_dtype(lo.dtype)
+    # Same arithmetic as np.mean, which accumulates float16 in float32
+    acc_dtype = np.float32 if res_dtype == np.float16 else res_dtype
+    if out is not None and out.dtype == res_dtype == acc_dtype:
+        # Compute in place
+        if n % 2 == 1:
+            np.copyto(out, lo)
+        else:
+            np.add(lo, hi, out=out, dtype=acc_dtype)
+            np.divide(out, 2, out=out)
+        return out
+
+    if n % 2 == 1:
+        res = np.array(lo, dtype=res_dtype)
+    else:
+        res = np.asarray(np.add(lo, hi, dtype=acc_dtype))
+        np.divide(res, 2, out=res)
+        res = res.astype(res_dtype, copy=False)
+    if out is None:
+        return res
+    out[...] = res
+    return out
+
+
+def network_median(data, axis, out=None):
+    """Compute the median along `axis` with a min/max network.
+
+    Each comparator is a vectorized :func:`numpy.minimum` and/or
+    :func:`numpy.maximum` over the whole observation. NaN is propagated just
+    like in :func:`numpy.median`, because a comparator with a NaN input
+    outputs NaN on both sides, so that a NaN reaches every position the NaN
+    input could have been sorted to. If `out` has the data type of `data`,
+    it doubles as the scratch space of the comparators.
+    """
+    n = data.shape[axis]
+    rows = [_take(data, k, axis) for k in range(n)]
+    tmp = out if out is not None and out.dtype == data.dtype else None
+    for i, j, need_min, need_max in median_network(n):
+        a, b = rows[i], rows[j]
+        if need_min and need_max:
+            if tmp is None:
+                tmp = np.empty_like(a)
+            np.minimum(a, b, out=tmp)
+            np.maximum(a, b, out=b)
+            # The old row `a` is not needed anymore and becomes scratch space
+            rows[i], tmp = tmp, a
+        elif need_min:
+            np.minimum(a, b, out=a)
+        else:
+            np.maximum(a, b, out=b)
+    return _mean_of_middle(rows[(n - 1) // 2], rows[n // 2], n, out)
+
+
+def partition_median(data, axis, out=None):
+    """Compute the median along `axis` with an in-place partition.
+
+    This is what :func:`numpy.median` does with ``overwrite_input=True``,
+    without the overhead of its generic argument handling.
+    """
+    n = data.shape[axis]
+    kth = [(n - 1) // 2, n // 2]
+    supports_nan = np.issubdtype(data.dtype, np.inexact)
+    if supports_nan:
+        # A NaN is partitioned to the last position
+        kth.append(n - 1)
+    data.partition(kth, axis=axis)
+    res = _mean_of_middle(_take(data, (n - 1) // 2, axis),
+                          _take(data, n // 2, axis), n, out)
+    if supports_nan:
+        # The last position holds the maximum, which is never smaller than
+        # the median, or NaN
+        np.minimum(res, _take(data, n - 1, axis), out=res)
+    return res
+
+
+def partition_quantiles(data, axis, quantiles):
+    """Compute several quantiles along `axis` with one in-place partition.
+
+    All order statistics needed for `quantiles` are partitioned at once. The
+    quantiles are interpolated linearly between them, like the default
+    method of :func:`numpy.quantile`. The quantiles are stacked along a new
+    first axis of the result. NaN is propagated.
+    """
+    n = data.shape[axis]
+    positions = (n - 1) * np.asarray(quantiles, dtype=np.float64)
+    lo_idx = np.floor(positions).astype(np.intp)
+    hi_idx = np.minimum(lo_idx + 1, n - 1)
+    kth = sorted(set(lo_idx) | set(hi_idx))
+    supports_nan = np.issubdtype(data.dtype, np.inexact)
+    if supports_nan:
+        # A NaN is partitioned to the last position
+        kth.append(n - 1)
+    data.partition(kth, axis=axis)
+
+    res_dtype = _result_dtype(data.dtype)
+    lo = np.moveaxis(np.take(data, lo_idx, axis=axis), axis, 0)
+    hi = np.moveaxis(np.take(data, hi_idx, axis=axis), axis, 0)
+    lo = lo.astype(res_dtype, copy=False)
+    hi = hi.astype(res_dtype, copy=False)
+    frac = (positions - lo_idx).astype(res_dtype)
+    frac = frac.reshape((-1,) + (1,) * (lo.ndim - 1))
+
+    # Same arithmetic as np.quantile, which interpolates from the nearer side
+    diff = hi - lo
+    res = np.where(frac >= 0.5, hi - diff * (1 - frac), lo + diff * frac)
+    res = res.astype(res_dtype, copy=False)
+    if supports_nan:
+        np.copyto(res, np.nan,
+                  where=np.isnan(np.take(data, n - 1, axis=axis)))
+    return res
+
+
+def numpy_median(data, axis, out=None):
+    """Compute the median along `axis` with :func:`numpy.median`."""
+    return np.median(data, axis=axis, out=out, overwrite_input=True)
+
+
+KERNELS = {
+    'network': network_median,
+    'partition': partition_median,
+    'numpy': numpy_median,
+}
+
+
+def get_kernel(kernel, n, layout='last', n_elems=None):
+    """Get the kernel to collapse arrays of `n` observations.
+
+    Parameters
+    ----------
+    kernel : str | callable
+        Either a callable ``kernel(data, axis)``, one of the names in
+        ``KERNELS``, or ``'auto'`` to pick a kernel based on `n` and
+        `n_elems`.
+    n : int
+        The number of observations in each collapse.
+    layout : {'last', 'first'}
+        The layout of the arrays, see :class:`remedian.Remedian`.
+    n_elems : None | int
+        The number of elements of each observation in each collapse. If
+        None, observations are assumed to be large.
+
+    Returns
+    -------
+    kernel : callable
+        The kernel.
+
+    """
+    if callable(kernel):
+        return kernel
+    if kernel == 'auto':
+        use_network = n <= NETWORK_MAX_N[layout] and (
+            n_elems is None or n_elems >= NETWORK_MIN_ELEMS[layout])
+        kernel = 'network' if use_network else 'partition'
+    if kernel not in KERNELS:
+        raise ValueError('`kernel` must be a callable, "auto", or one of '
+                         f'{sorted(KERNELS)}, but got: {kernel}')
+    return KERNELS[kernel]
+
+
+def apply_kernel(kernel, data, axis, out):
+    """Write the median of `data` along `axis` computed by `kernel` to `out`.
+
+    The kernels in ``KERNELS`` write into `out` directly, the median returned
+    by any other kernel is copied into `out`.
+    """
+    if kernel in KERNELS.values():
+        kernel(data, axis, out=out)
+    else:
+        out[...] = kernel(data, axis)
+
+
+def weighted_median(values, weights):
+    """Compute the weighted median along the last axis.
+
+    The weighted median is the smallest value for which the cumulative weight
+    of all values up to and including it reaches half of the total weight. If
+    it reaches exactly half, the mean of this value and the next value is
+    taken, so that for equal weights the result equals :func:`numpy.median`.
+
+    Parameters
+    ----------
+    values : ndarray, shape(..., n)
+        The values.
+    weights : ndarray of int
+        The weights of the values, broadcastable to `values`.
+
+    Returns
+    -------
+    median : ndarray, shape(...)
+        The weighted median. NaN where any of the values is NaN.
+
+    """
+    order = np.argsort(values, axis=-1)
+    values_sorted = np.take_along_axis(values, order, axis=-1)
+    weights = np.broadcast_to(weights, values.shape)
+    cum_weights = np.cumsum(np.take_along_axis(weights, order, axis=-1),
+                            axis=-1)
+    total = cum_weights[..., -1:]
+
+    # Integer comparisons with twice the cumulative weight avoid rounding
+    lo = np.argmax(2 * cum_weights >= total, axis=-1)[..., np.newaxis]
+    hi = np.argmax(2 * cum_weights > total, axis=-1)[..., np.newaxis]
+    lo = np.take_along_axis(values_sorted, lo, axis=-1)[..., 0]
+    hi = np.take_along_axis(values_sorted, hi, axis=-1)[..., 0]
+    res = _mean_of_middle(lo, hi, 2)
+    np.copyto(res, lo, where=lo == hi)
+    if np.issubdtype(values.dtype, np.inexact):
+        np.copyto(res, np.nan, where=np.isnan(values).any(axis=-1))
+    return res
+
+
+def nan_weighted_median(values, weights):
+    """Compute the weighted median along the last axis, ignoring NaN.
+
+    Like :func:`weighted_median`, but NaN values get no weight. Changes
+    `values` in place.
+
+    Returns
+    -------
+    median : ndarray, shape(...)
+        The weighted median, NaN where all values are NaN or have no weight.
+    total : ndarray of int, shape(...)
+        The total weight of the values that are not NaN.
+
+    """
+    weights = np.where(np.isnan(values), 0, weights)
+    total = weights.sum(axis=-1)
+    # Values without weight are never selected, but must not propagate NaN
+    np.copyto(values, 0, where=weights == 0)
+    res = weighted_median(values, weights)
+    np.copyto(res, np.nan, where=total == 0)
+    return res, total
+
+
+def nan_median(data, axis, kernel=partition_median, counts=None):
+    """Compute the median along `axis`, ignoring NaN.
+
+    The median of each element without NaN is computed by `kernel`. The
+    values of each element with NaN are sorted instead, and the middle of
+    its valid values is selected. If
+    `counts` is not None, each value stands for as many valid observations,
+    and the weighted median is taken, unless all counts are equal. May
+    change `data` in place.
+
+    Parameters
+    ----------
+    data : ndarray
+        The values.
+    axis : int
+        The axis along which to compute the median.
+    kernel : callable
+        The kernel to compute the median without NaN.
+    counts : None | ndarray of int
+        The number of valid observations of each value in `data`.
+
+    Returns
+    -------
+    median : ndarray
+        The median, NaN where all values are NaN.
+    n_valid : ndarray of int
+        The number of valid observations of each median.
+
+    """
+    axis = axis % data.ndim
+    n = data.shape[axis]
+    if counts is not None:
+        total = counts.sum(axis=axis)
+        if counts.min() == counts.max() > 0:
+            # Same weights, and no NaN, which would have a count of 0
+            return kernel(data, axis), total
+        return nan_weighted_median(np.moveaxis(data, axis, -1),
+                                   np.moveaxis(counts, axis, -1))
+
+    is_nan = np.isnan(data)
+    if not is_nan.any():
+        return kernel(data, axis), np.full(
+            data.shape[:axis] + data.shape[axis+1:], n, dtype=np.int64)
+    # Only the elements with NaN are sorted, the others go to the kernel
+    has_nan = is_nan.any(axis=axis)
+    data = np.moveaxis(data, axis, -1)
+    res = np.empty(has_nan.shape, dtype=_result_dtype(data.dtype))
+    if not has_nan.all():
+        res[~has_nan] = kernel(data[~has_nan], -1)
+    n_valid = np.full(has_nan.shape, n, dtype=np.int64)
+    n_valid[has_nan] = n - np.count_nonzero(
+        np.moveaxis(is_nan, axis, -1)[has_nan], axis=-1)
+    res[has_nan] = _median_of_valid(data[has_nan], n_valid[has_nan])
+    return res, n_valid
+
+
+def _median_of_valid(data, n_valid):
+    """Get the median of the first `n_valid` values along the last axis.
+
+    Sorts `data`, which moves NaN to the end.
+    """
+    data.sort(axis=-1)
+    lo = np.maximum(n_valid - 1, 0)[:, None] // 2
+    hi = n_valid[:, None] // 2
+    lo = np.take_along_axis(data, lo, axis=-1)[:, 0]
+    hi = np.take_along_axis(data, hi, axis=-1)[:, 0]
+    res = _mean_of_middle(lo, hi, 2)
+    np.copyto(res, lo, where=n_valid % 2 == 1)
+    np.copyto(res, np.nan, where=n_valid == 0)
+    return res
@@ -0,0 +1,225 @@
+"""Contains a bank of Remedians for many independent groups."""
+
+# License: MIT
+
+import numpy as np
+
+from remedian._kernels import get_kernel, weighted_median
+from remedian.remedian import _level_size, _median_dtype
+
+
+class RemedianBank:
+    """Remedians of many independent groups of observations.
+
+    Each group, for example a sensor or an endpoint, gets its own remedian of
+    an unbounded number of observations, just like a :class:`Remedian` with
+    ``t=None``. However, the arrays of all groups are stored together in one
+    array per level with a leading group axis, and observations of many
+    groups are added with a single vectorized call. All groups whose arrays
+    are full, and all complete chunks of `n_obs` observations of each group
+    in the same call, are collapsed together with a single call of the
+    median kernel for each array.
+
+    Parameters
+    ----------
+    n_groups : int
+        The number of groups.
+    n_obs : int | sequence of int
+        The number of observations to be stored within each array, see
+        :class:`Remedian`.
+    obs_size : tuple of int
+        The shape of each observation. Defaults to ``()`` for scalars.
+    dtype : data-type
+        The data type in which the observations are stored. Intermediate
+        medians and the estimates are stored in a floating point type, see
+        :class:`Remedian`.
+    kernel : str | callable
+        The median kernel used to collapse full arrays, see
+        :class:`Remedian`.
+
+    Attributes
+    ----------
+    obs_count : ndarray of int, shape(n_groups)
+        The number of observations added to each group.
+    k_arrs : int
+        The current number of arrays, which grows with the number of
+        observations of the largest group.
+    arrs : list of ndarray, shape(n_groups, n_obs, *obs_size)
+        The arrays of all groups.
+    obs_idx_counter : list of ndarray of int, shape(n_groups)
+        The number of filled positions of each array for each group.
+
+    """
+
+    def __init__(self, n_groups, n_obs, obs_size=(), dtype=np.float64,
+                 kernel='auto'):
+        """Initialize the RemedianBank object.
+
+        See class docstring for more thorough information.
+
+        Parameters
+        ----------
+        n_groups : int
+            Number of groups.
+        n_obs : int | sequence of int
+            Observations per array.
+        obs_size : tuple of int
+            Shape of the observations.
+        dtype : data-type
+            Data type of the observations.
+        kernel : str | callable
+            Median kernel used to collapse full arrays.
+
+        """
+        if np.size(n_obs) == 0 or np.min(n_obs) <= 1:
+            raise ValueError('`n_obs` of <= 1 does not make sense.')
+        if n_groups < 1:
+            raise ValueError(f'`n_groups` must be at least 1, but got: '
+                             f'{n_groups}')
+        self.n_groups = n_groups
+        self.n_obs = n_obs if np.isscalar(n_obs) else [int(n) for n in n_obs]
+        self.obs_size = tuple(obs_size)
+        self.dtype = np.dtype(dtype)
+        self.median_dtype = _median_dtype(self.dtype)
+        self.kernel = kernel
+
+        self.obs_count = np.zeros(n_groups, dtype=np.int64)
+        self.k_arrs = 0
+        self.k_arr_sizes = []
+        self.arrs = []
+        self.obs_idx_counter = []
+        # The number of observations represented by each value of each array
+        self._weights = []
+        self._add_arr()
+
+    def _add_arr(self):
+        """Add another array on top of the existing ones for all groups."""
+        size = _level_size(self.n_obs, self.k_arrs)
+        dtype = self.dtype if self.k_arrs == 0 else self.median_dtype
+        weight = (1 if self.k_arrs == 0 else
+                  self._weights[-1] * self.k_arr_sizes[-1])
+        self.k_arrs += 1
+        self.k_arr_sizes.append(size)
+        self.arrs.append(np.zeros((self.n_groups, size) + self.obs_size,
+                                  dtype=dtype))
+        self.obs_idx_counter.append(np.zeros(self.n_groups, dtype=np.int64))
+        self._weights.append(weight)
+
+    def add_obs(self, group_ids, values):
+        """Add observations to several groups at once.
+
+        The result is identical to adding the observations one after another
+        to a :class:`Remedian` of each group. Several observations of the
+        same group are added in the order in which they appear.
+
+        Parameters
+        ----------
+        group_ids : ndarray of int, shape(n_values)
+            The group of each observation.
+        values : ndarray, shape(n_values, *obs_size)
+            The observations.
+
+        """
+        group_ids = np.asarray(group_ids, dtype=np.intp).reshape(-1)
+        values = np.asanyarray(values)
+        if values.shape != group_ids.shape + self.obs_size:
+            raise ValueError(f'Expected values of shape '
+                             f'{group_ids.shape + self.obs_size} for '
+                             f'{len(group_ids)} group ids, but received: '
+                             f'{values.shape}')
+        if len(group_ids) and (group_ids.min() < 0 or
+                               group_ids.max() >= self.n_groups):
+            raise ValueError(f'Group ids must be between 0 and '
+                             f'{self.n_groups - 1}.')
+
+        # Sort by group, keeping the order of the observations of each group
+        order = np.argsort(group_ids, kind='stable')
+        self.obs_count += np.bincount(group_ids, minlength=self.n_groups)
+        self._push(0, group_ids[order], values[order])
+
+    def _push(self, arr_i, group_ids, values):
+        """Put `values` into array `arr_i` of their groups, sorted by group.
+
+        Each group fills up its array first. If it is full, it is collapsed,
+        all further complete chunks of `n_obs` values of the group are
+        collapsed at once without being stored, and the rest is stored. The
+        medians are pushed on to the next array in the same order.
+        """
+        if arr_i == self.k_arrs:
+            self._add_arr()
+        size = self.k_arr_sizes[arr_i]
+        arr = self.arrs[arr_i]
+        counter = self.obs_idx_counter[arr_i]
+        values = values.astype(arr.dtype, copy=False)
+
+        # The rank of each value within its group
+        counts = np.bincount(group_ids, minlength=self.n_groups)
+        starts = np.cumsum(counts) - counts
+        ranks = np.arange(len(group_ids)) - starts[group_ids]
+        n_free = size - counter
+
+        # Fill the arrays, and collapse the full ones
+        head = ranks < n_free[group_ids]
+        arr[group_ids[head], counter[group_ids[head]] + ranks[head]] = \
+            values[head]
+        full = np.flatnonzero(counts >= n_free)
+        next_ids = [full]
+        next_values = [self._median(arr_i, arr[full])]
+
+        # Collapse the complete chunks of the remaining values at once, and
+        # store the rest
+        n_tail = np.maximum(counts - n_free, 0)
+        tail_ranks = ranks - n_free[group_ids]
+        chunk = tail_ranks // size
+        complete = ~head & (chunk < (n_tail // size)[group_ids])
+        next_ids.append(group_ids[complete][::size])
+        next_values.append(self._median(
+            arr_i, values[complete].reshape((-1, size) + self.obs_size)))
+        rest = ~head & ~complete
+        arr[group_ids[rest], tail_ranks[rest] % size] = values[rest]
+        counter += np.minimum(counts, n_free)
+        counter[full] = n_tail[full] % size
+
+        # The median of the full array comes first within each group
+        next_ids = np.concatenate(next_ids)
+        if len(next_ids):
+            order = np.argsort(next_ids, kind='stable')
+            self._push(arr_i + 1, next_ids[order],
+                       np.concatenate(next_values)[order])
+
+    def _median(self, arr_i, data):
+        """Get the medians of `data` with the values of each along axis 1."""
+        if not len(data):
+            return np.empty((0,) + self.obs_size, dtype=self.median_dtype)
+        kernel = get_kernel(self.kernel, self.k_arr_sizes[arr_i],
+                            n_elems=data[:, 0].size)
+        return kernel(data, 1)
+
+    def estimate(self):
+        """Estimate the remedian of each group.
+
+        The estimate of each group is the weighted median of all values in
+        the filled positions of its arrays, see :meth:`Remedian.estimate`.
+
+        Returns
+        -------
+        estimate : ndarray, shape(n_groups, *obs_size)
+            The current approximation of the median of each group. NaN for
+            groups without observations.
+
+        """
+        values = np.concatenate([arr.astype(self.median_dtype, copy=False)
+                                 for arr in self.arrs], axis=1)
+        weights = np.concatenate([
+            np.where(np.arange(size) < counter[:, np.newaxis], weight, 0)
+            for size, counter, weight in zip(self.k_arr_sizes,
+                                             self.obs_idx_counter,
+                                             self._weights)], axis=1)
+        # Unfilled positions have no weight, but must not propagate NaN
+        values[weights == 0] = 0
+        values = np.moveaxis(values, 1, -1)
+        weights = weights.reshape((self.n_groups,) +
+                                  (1,) * len(self.obs_size) + (-1,))
+        estimate = weighted_median(values, weights)
+        estimate[self.obs_count == 0] = np.nan
+        return estimate
@@ -3,8 +3,96 @@
 # Author: Stefan Appelhoff <stefan.appelhoff@mailbox.org>
 # License: MIT
 
+import asyncio
+import functools
+import json
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
 import numpy as np
 
+from remedian._kernels import (
+    apply_kernel,
+    get_kernel,
+    nan_median,
+    nan_weighted_median,
+    network_median,
+    partition_quantiles,
+    weighted_median,
+)
+
+# Size of the tiles in which an array is collapsed on several threads. Each
+# tile should fit into the CPU cache
+TILE_BYTES = 2**20
+
+# Parameters and attributes of a Remedian stored by Remedian.save
+_SAVED_PARAMS = ['layout', 'dtype', 'kernel', 'n_jobs', 'spill_from',
+                 'block_bytes', 'quantiles', 'background', 'summary',
+                 'nan_policy']
+_SAVED_ATTRS = ['obs_size', 'n_obs', 't', 'k_arrs', 'obs_idx_counter',
+                'obs_count'] + _SAVED_PARAMS
+
+RemedianSummary = namedtuple('RemedianSummary', ['remedian', 'count', 'mean',
+                                                 'var', 'min', 'max'])
+RemedianSummary.__doc__ = """Summary statistics of a Remedian with summary=True.
+
+Attributes
+----------
+remedian : ndarray, shape(obs_size)
+    The remedian, or its estimate if not all observations have been added,
+    with a leading quantile axis if `quantiles` were passed.
+count : int
+    The number of observations.
+mean : ndarray of float64, shape(obs_size)
+    The mean of the observations.
+var : ndarray of float64, shape(obs_size)
+    The variance of the observations, with ``ddof=0``.
+min : ndarray, shape(obs_size)
+    The minimum of the observations.
+max : ndarray, shape(obs_size)
+    The maximum of the observations.
+
+"""
+
+RemedianPlan = namedtuple('RemedianPlan', ['n_obs', 'k_arrs', 'k_arr_sizes',
+                                           'nbytes', 'n_collapses',
+                                           'variance_factor'])
+RemedianPlan.__doc__ = """Parameters of a Remedian chosen by Remedian.plan.
+
+Attributes
+----------
+n_obs : int
+    The number of observations to be stored within each array.
+k_arrs : int
+    The number of arrays.
+k_arr_sizes : list of int
+    The size of each array.
+nbytes : int
+    The number of bytes of all arrays together, including the memory needed
+    for `quantiles`, `nan_policy` and `background`.
+n_collapses : list of int
+    The number of collapses of each array.
+variance_factor : float
+    The expected variance of the remedian relative to the variance of the
+    median, based on the asymptotic distribution of the remedian [1]_:
+    Each array apart from the first one increases the variance by about
+    ``pi / 2``.
+
+References
+----------
+.. [1] M. Chao, G. Lin, "The asymptotic distributions of the remedians",
+   Journal of Statistical Planning and Inference, vol. 37 (1993), pp. 1-11
+
+"""
+
+# Methods that are replaced by timed versions with instrument=True
+_INSTRUMENTED = ['_collapse', '_collapse_groups', 'add_obs', 'add_obs_batch',
+                 'estimate']
+
 
 class Remedian:
     """Remedian object for a robust averaging method for large data sets.
@@ -19,29 +107,169 @@ class Remedian:
     obs_size : ndarray
         The shape of each data chunk (=observation) to be fed into the Remedian
         object.
-    n_obs : int
+    n_obs : int | sequence of int
         The number of observations to be stored within each array.
         If `n_obs` >= `t`, Remedian will equal the median. The smaller this
         parameter, the fewer data have to be loaded into memory at once, but
-        the less accurate the approximation of the median will be.
-    t : int
+        the less accurate the approximation of the median will be. If a
+        sequence, the number for each array starting with the first array,
+        where the last number is used for all further arrays. For example,
+        ``[5, 50]`` collapses the first array often and cheaply, while each
+        median in the higher arrays is taken over more values. If None,
+        `n_obs` is chosen to fit into `memory_budget`, see :meth:`plan`.
+    t : int | None
         The total number of observations from which a median should be
-        approximated.
+        approximated. If None, the number of observations is unbounded and
+        arrays are added whenever the highest array is full, see
+        :meth:`estimate` to get the remedian at any time.
+    layout : {'last', 'first'}
+        Where the observation index is stored in each of the arrays. For
+        ``'last'`` (default), each array has shape ``obs_size + [n]``. For
+        ``'first'``, each array has shape ``[n] + obs_size``, so that every
+        observation is stored contiguously in memory. This speeds up adding
+        observations of large `obs_size`.
+    dtype : data-type | None
+        The data type in which the observations are stored. Defaults to
+        ``np.float64``. If None, the data type of the first observation that
+        is added is used. Intermediate medians and the remedian are stored
+        in `dtype` itself for floating point types, and otherwise in
+        ``np.result_type(dtype, np.float32)``, the smallest floating point
+        type of at least 32 bits that can represent all values of an integer
+        `dtype`. For example, ``np.uint8`` and ``np.int16`` observations
+        give ``np.float32`` medians and ``np.int32`` observations give
+        ``np.float64`` medians. Each array can add a fractional bit to the
+        medians, which are exact as long as the integers and these bits fit
+        into the mantissa, that is, for up to 16 arrays of ``np.uint8``
+        observations.
+    kernel : str | callable
+        The function that computes the median of a full array when it is
+        collapsed into the next array. Can be ``'network'`` for a vectorized
+        min/max network that is fast for small `n_obs`, ``'partition'`` for an
+        in-place partition that is fast for large `n_obs`, ``'numpy'`` for
+        :func:`numpy.median`, or ``'auto'`` (default) to pick between
+        ``'network'`` and ``'partition'`` based on `n_obs` and `layout`. All
+        of these give the same results. A callable must have the signature
+        ``kernel(data, axis)`` and return the median of `data` along `axis`.
+        It may overwrite `data`.
+    n_jobs : int
+        The number of threads used to collapse an array. If larger than 1,
+        the elements of the observations are split into tiles that are
+        collapsed in parallel, which gives the same results. If -1, use all
+        CPUs. Useful for large `obs_size`.
+    spill_dir : None | path-like
+        If not None, arrays are stored in temporary memory-mapped files in
+        this directory instead of in memory, see `spill_from`. The files are
+        deleted when the Remedian is garbage collected.
+    spill_from : int
+        Index of the first array to store in `spill_dir`. Defaults to 1, so
+        that the first array, to which every observation is written, stays in
+        memory, while the rarely used higher arrays are memory-mapped. Use 0
+        to memory-map all arrays.
+    block_bytes : None | int
+        If not None, arrays are collapsed in blocks of elements of the
+        observations, such that each block of an array is at most about this
+        many bytes, which bounds the memory needed for a collapse. Defaults
+        to a few MB if `spill_dir` is not None or `n_jobs` is larger than 1,
+        and to no blocks otherwise.
+    checkpoint_path : None | path-like
+        If not None, the state is saved to this path with :meth:`save` every
+        `checkpoint_every` observations, so that it can be resumed with
+        :meth:`load` after a crash.
+    checkpoint_every : None | int
+        The number of observations between two checkpoints.
+    instrument : bool
+        If True, measure where the time is spent, see `stats`. If False
+        (default), the methods of the Remedian are not changed at all, so
+        that there is no overhead.
+    on_collapse : None | callable
+        If not None, is called as ``on_collapse(arr_i, duration)`` after each
+        collapse of array `arr_i` that took `duration` seconds, for example
+        to forward metrics. Implies ``instrument=True``.
+    memory_budget : None | int
+        The number of bytes that all arrays together may use, including the
+        memory needed for `quantiles`, `nan_policy` and `background`. Must be
+        passed if and only if `n_obs` is None, together with a bounded `t`
+        and a `dtype`.
+    quantiles : None | sequence of float
+        If not None, estimate these quantiles between 0 and 1 instead of the
+        median, in a single pass over the observations. The first array is
+        shared by all quantiles: Each collapse extracts all quantiles from it
+        with a single partition, interpolated like :func:`numpy.quantile`.
+        All higher arrays get a leading quantile axis and take the median of
+        the estimates of each quantile with `kernel`. The `remedian` and
+        :meth:`estimate` get a leading quantile axis as well.
+    background : bool
+        If True, the first array is swapped with a spare array as soon as it
+        is full, and the collapses are done on a background thread, so that
+        :meth:`add_obs` returns at once. Only one collapse is pending at a
+        time: If the first array is full again before, :meth:`add_obs` waits
+        for it. See :meth:`aadd_obs` to wait without blocking an
+        :mod:`asyncio` event loop, and :meth:`flush` to wait for the
+        collapse. The results are identical to the ones with ``False``
+        (default), at the cost of the memory of the spare array.
+    summary : bool
+        If True, also compute the count, mean, variance, minimum and maximum
+        of the observations while they are added, see :meth:`summarize`. The
+        mean and variance are updated with Welford's algorithm in float64.
+        They propagate NaN regardless of `nan_policy`.
+    nan_policy : {'propagate', 'omit'}
+        How to handle NaN in the observations. For ``'propagate'``
+        (default), the remedian of an element is NaN if any of its
+        observations is NaN, like for :func:`numpy.median`. For ``'omit'``,
+        NaN is ignored: Each median is taken over the valid values only, and
+        the number of valid observations it represents is stored alongside
+        it in the higher arrays. The medians in the higher arrays and in the
+        remedian are then weighted by these numbers instead of by the number
+        of all observations, so that elements with many NaN are not biased
+        towards a few observations. Arrays without NaN are collapsed with
+        `kernel` as usual. Cannot be combined with `quantiles`.
+    out : None | ndarray
+        If not None, the remedian is written into this C-contiguous array of
+        the shape of `remedian` instead of a new array once all `t`
+        observations have been added, and `remedian` is `out` itself. Use
+        this together with :meth:`reset` to compute a remedian per session
+        without allocating any memory.
 
     Attributes
     ----------
     obs_count : int
         Counter of number of observations that have already been given
         to the Remedian object.
+    k_arrs : int
+        The current number of arrays. Only grows if `t` is None.
     remedian : None | ndarray, shape(obs_size)
-        The calculated remedian of the same shape as the input data.
+        The calculated remedian of the same shape as the input data, with a
+        leading quantile axis if `quantiles` is not None.
         Will be None until all observations `n_obs` have been fed into
         the object using the add_obs method.
+    dtype : None | numpy.dtype
+        The data type of the observations. None until it has been inferred
+        from the first observation if ``dtype=None`` was passed.
+    median_dtype : None | numpy.dtype
+        The data type of intermediate medians and of the remedian.
+    stats : dict
+        A snapshot of the measurements if ``instrument=True``, with keys:
+
+        - ``'obs_count'``: the number of observations added
+        - ``'ingest_time'``: seconds spent in :meth:`add_obs` and
+          :meth:`add_obs_batch`, including collapses and the final remedian
+        - ``'obs_per_sec'``: observations added per second of `ingest_time`
+        - ``'collapse_count'``: the number of collapses of each array
+        - ``'collapse_time'``: seconds spent collapsing each array
+        - ``'collapse_max_time'``: the longest collapse of each array in
+          seconds
+        - ``'estimate_time'``: seconds spent computing the remedian or an
+          estimate of it from all arrays
+        - ``'resident_bytes'``: bytes of each array in memory, which is 0 for
+          memory-mapped arrays
 
     Notes
     -----
     Given a data chunk of size `obs_size`, and `t` data chunks overall, the
     Remedian class sets up a number `k_arrs` of arrays of length `n_obs`.
+    If `n_obs` is a sequence, each array has its own length instead, and
+    all occurrences of `n_obs` below refer to the length of the respective
+    array.
 
     The median of the `t` data chunks of size `obs_size` is then approximated
     as follows: One data chunk after another is fed into the `n_obs` positions
@@ -51,8 +279,16 @@ class Remedian:
     When the second array is full, the median of its values is stored in the
     first position of the third array, and so on.
 
-    The final "Remedian" is the median of the last array, after all `t` data
-    chunks have been fed into the object.
+    The final "Remedian" is computed after all `t` data chunks have been fed
+    into the object. It is the weighted median of the values in the filled
+    positions of all arrays, where each value is weighted by the number of
+    data chunks it represents: 1 in the first array, `n_obs` in the second
+    array, ``n_obs**2`` in the third array, and so on. This way, no data
+    chunk is lost if `t` is not a power of `n_obs`, and unfilled positions of
+    the last array do not enter the result.
+
+    If `t` is None, the number of arrays is not known in advance. Instead, a
+    new array is added whenever the highest array is full.
 
     In other words, given an n-dimensional array, the Remedian class
     approximates the median of this array across the ith dimension and you have
@@ -73,7 +309,12 @@ class Remedian:
 
     """
 
-    def __init__(self, obs_size, n_obs, t):
+    def __init__(self, obs_size, n_obs, t, layout='last', dtype=np.float64,
+                 kernel='auto', n_jobs=1, spill_dir=None, spill_from=1,
+                 block_bytes=None, checkpoint_path=None,
+                 checkpoint_every=None, instrument=False, on_collapse=None,
+                 memory_budget=None, quantiles=None, background=False,
+                 summary=False, nan_policy='propagate', out=None):
         """Initialize the Remedian object.
 
         See class docstring for more thorough information.
@@ -81,53 +322,331 @@ class Remedian:
         Parameters
         ----------
         obs_size : ndarray
-            Size of the observations. Must be (1,) for scalars.
-        n_obs : int
+            Size of the observations. Must be (1,) for scalars, see also
+            :class:`ScalarRemedian`.
+        n_obs : int | sequence of int | None
             Observations per array.
-        t : int
-            Number of total observations.
+        t : int | None
+            Number of total observations, or None if unbounded.
+        layout : {'last', 'first'}
+            Position of the observation axis in the arrays.
+        dtype : data-type | None
+            Data type of the observations.
+        kernel : str | callable
+            Median kernel used to collapse full arrays.
+        n_jobs : int
+            Number of threads used to collapse an array.
+        spill_dir : None | path-like
+            Directory for memory-mapped arrays.
+        spill_from : int
+            Index of the first memory-mapped array.
+        block_bytes : None | int
+            Maximum size of the blocks in which an array is collapsed.
+        checkpoint_path : None | path-like
+            Path to save checkpoints to.
+        checkpoint_every : None | int
+            Number of observations between two checkpoints.
+        instrument : bool
+            Whether to measure where the time is spent.
+        on_collapse : None | callable
+            Function called after each collapse.
+        memory_budget : None | int
+            Bytes all arrays may use together if `n_obs` is None.
+        quantiles : None | sequence of float
+            Quantiles to estimate instead of the median.
+        background : bool
+            Whether to collapse arrays on a background thread.
+        summary : bool
+            Whether to compute summary statistics as well.
+        nan_policy : {'propagate', 'omit'}
+            How to handle NaN in the observations.
+        out : None | ndarray
+            Array to write the remedian to.
 
         """
-        if n_obs <= 1:
-            raise ValueError('`n_obs` of <= 1 does not make sense.')
+        n_obs = self._check_n_obs(obs_size, n_obs, t, dtype, memory_budget,
+                                  quantiles, nan_policy, background)
+        if t is not None and t < 1:
+            raise ValueError(f'`t` must be at least 1, but got: {t}')
+        if layout not in ('last', 'first'):
+            raise ValueError('`layout` must be one of "last" or "first", but '
+                             f'got: {layout}')
 
-        self.obs_size = list(obs_size)
+        # Python ints, which can be saved as JSON unlike NumPy integers
+        self.obs_size = [int(size) for size in obs_size]
         self.n_obs = n_obs
-        self.t = t
+        self.t = None if t is None else int(t)
+        # The initial `t`, which is restored by reset
+        self._t_init = self.t
+        self.layout = layout
+        self.kernel = kernel
+        self.quantiles = _check_quantiles(quantiles)
+        self.nan_policy = _check_nan_policy(nan_policy, self.quantiles)
+        if n_jobs != -1 and n_jobs < 1:
+            raise ValueError('`n_jobs` must be at least 1 or -1, but got: '
+                             f'{n_jobs}')
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self._executor = None
+        self.spill_dir = spill_dir
+        self.spill_from = spill_from
+        if block_bytes is None and (spill_dir is not None or self.n_jobs > 1):
+            block_bytes = TILE_BYTES
+        self.block_bytes = block_bytes
+        if (checkpoint_path is None) != (checkpoint_every is None):
+            raise ValueError('`checkpoint_path` and `checkpoint_every` must '
+                             'be passed together.')
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.summary = summary
+        # Count, mean, sum of squared deviations from the mean, min and max
+        self._moments = None
+        self._moments_tmp = None
+        self.background = background
+        self._worker = None
+        self._pending = None
+        self._spare = None
+
+        # The axis of each array along which observations are stored
+        self._axis = -1 if self.layout == 'last' else 0
 
         # Calculate the number of arrays needed and their sizes
         self.k_arrs = self._calc_k_arrs()
         self.k_arr_sizes = self._calc_k_arr_sizes()
 
-        # Initialize the arrays
-        self.arrs = [np.zeros(self.obs_size+[s]) for s in self.k_arr_sizes]
+        # Pick the median kernel for collapsing each array
+        self._kernels = [self._get_kernel(arr_i, size)
+                         for arr_i, size in enumerate(self.k_arr_sizes)]
+        if self.quantiles is not None:
+            self._kernels[0] = functools.partial(partition_quantiles,
+                                                 quantiles=self.quantiles)
+
+        # Initialize the arrays, or wait for the first observation if we
+        # need to infer the data type from it
+        self.dtype = None
+        self.median_dtype = None
+        self.arrs = []
+        self._n_valid = None
+        if dtype is not None:
+            self._init_arrs(dtype)
 
         # counter for observations within each array
         self.obs_idx_counter = [0 for arr in range(self.k_arrs)]
 
-        # Modulos of observations to assign to correct array later
-        self.modulos = [self.n_obs**i for i in range(1, 1+self.k_arrs)]
+        # Modulos of observations to assign to correct array later, that is,
+        # the number of observations represented by each full array
+        self.modulos = list(np.cumprod(
+            [_level_size(self.n_obs, arr_i) for arr_i in range(self.k_arrs)],
+            dtype=object))
 
         # Counter of received observations
         self.obs_count = 0
 
+        # Measurements, which replace some methods with timed versions
+        self.on_collapse = on_collapse
+        self.instrument = instrument or on_collapse is not None
+        self._stats = None
+        if self.instrument:
+            self._stats = {'ingest_time': 0., 'estimate_time': 0.,
+                           'collapse_count': [], 'collapse_time': [],
+                           'collapse_max_time': []}
+            self._instrument()
+
         # Set the median value to None until we have it
         self.remedian = None
+        self.out = out
 
     def _calc_k_arrs(self):
         """Calculate number of arrays to accommodate the observations."""
-        tmp = self.n_obs
-        k_arrs = 1
-        while tmp <= self.t:
-            tmp *= self.n_obs
-            k_arrs += 1
-        return k_arrs
+        if self.t is None:
+            # Start with a single array and add more when needed
+            return 1
+        return len(_calc_arr_sizes(self.n_obs, self.t))
 
     def _calc_k_arr_sizes(self):
         """Calculate the size of each array to accomodate the observations."""
-        k_arr_sizes = [self.n_obs for i in range(self.k_arrs)]
-        k_arr_sizes[-1] = int(np.ceil(self.t / (self.n_obs**(self.k_arrs-1))))
-        return k_arr_sizes
+        if self.t is None:
+            return [_level_size(self.n_obs, i) for i in range(self.k_arrs)]
+        return _calc_arr_sizes(self.n_obs, self.t)
+
+    @staticmethod
+    def plan(obs_size, t, memory_budget, dtype=np.float64, quantiles=None,
+             nan_policy='propagate', background=False):
+        """Choose `n_obs` for the best accuracy within a memory budget.
+
+        The accuracy of the remedian mostly depends on the number of arrays:
+        Each array apart from the first one increases the variance of the
+        remedian by about ``pi / 2`` compared to the median [1]_. Therefore,
+        the fewest arrays that fit into `memory_budget` are chosen. For this
+        number of arrays, the largest `n_obs` that fits is chosen, because it
+        computes more exact medians over more observations. If `n_obs` can be
+        `t`, the remedian is the median.
+
+        Parameters
+        ----------
+        obs_size : ndarray
+            The shape of each observation.
+        t : int
+            The total number of observations.
+        memory_budget : int
+            The number of bytes that all arrays together may use.
+        dtype : data-type
+            The data type of the observations.
+        quantiles : None | sequence of float
+            The quantiles to estimate, whose leading axis in all arrays but
+            the first one needs memory as well, see :class:`Remedian`.
+        nan_policy : {'propagate', 'omit'}
+            How to handle NaN. ``'omit'`` needs memory for the numbers of
+            valid observations, see :class:`Remedian`.
+        background : bool
+            Whether to collapse on a background thread, which needs memory
+            for a spare first array, see :class:`Remedian`.
+
+        Returns
+        -------
+        plan : RemedianPlan
+            The chosen `n_obs`, the resulting number of arrays, their sizes
+            and bytes, the number of collapses of each array as a measure of
+            the computational cost, and the expected variance factor.
+
+        References
+        ----------
+        .. [1] M. Chao, G. Lin, "The asymptotic distributions of the
+           remedians", Journal of Statistical Planning and Inference, vol. 37
+           (1993), pp. 1-11
+
+        """
+        t = int(t)
+        n_elems = int(np.prod(obs_size))
+        itemsize = np.dtype(dtype).itemsize
+        # Bytes of each value in the arrays above the first one
+        median_itemsize = _median_dtype(dtype).itemsize
+        if quantiles is not None:
+            median_itemsize *= len(quantiles)
+        if nan_policy == 'omit':
+            median_itemsize += np.dtype(np.int64).itemsize
+
+        def nbytes(n_obs):
+            sizes = _calc_arr_sizes(n_obs, t)
+            # The spare array is only needed if the first array is collapsed
+            n_first = 2 if background and len(sizes) > 1 else 1
+            return n_elems * (n_first * sizes[0] * itemsize +
+                              sum(sizes[1:]) * median_itemsize)
+
+        def make_plan(n_obs):
+            sizes = _calc_arr_sizes(n_obs, t)
+            n_collapses = [t // n_obs**(arr_i + 1)
+                           for arr_i in range(len(sizes) - 1)] + [0]
+            return RemedianPlan(n_obs, len(sizes), sizes, nbytes(n_obs),
+                                n_collapses,
+                                (np.pi / 2)**max(0, len(sizes) - 2))
+
+        # The exact median, also for a single observation
+        if nbytes(max(2, t)) <= memory_budget:
+            return make_plan(max(2, t))
+        # For k arrays, n_obs**(k-1) <= t < n_obs**k. Within this range, the
+        # bytes grow with n_obs, so we look for the largest n_obs that fits
+        for k_arrs in range(2, max(2, t.bit_length()) + 1):
+            n_lo = max(2, _iroot(t, k_arrs) + 1)
+            n_hi = _iroot(t, k_arrs - 1)
+            if n_lo > n_hi or nbytes(n_lo) > memory_budget:
+                continue
+            while n_lo < n_hi:
+                n_mid = (n_lo + n_hi + 1) // 2
+                if nbytes(n_mid) <= memory_budget:
+                    n_lo = n_mid
+                else:
+                    n_hi = n_mid - 1
+            return make_plan(n_lo)
+        raise ValueError(f'A memory budget of {memory_budget} bytes is too '
+                         f'small, at least {nbytes(2)} bytes are needed.')
+
+    @classmethod
+    def _check_n_obs(cls, obs_size, n_obs, t, dtype, memory_budget,
+                     quantiles, nan_policy, background):
+        """Check `n_obs`, or choose it for the `memory_budget` parameter."""
+        if (n_obs is None) == (memory_budget is None):
+            raise ValueError('Exactly one of `n_obs` and `memory_budget` must '
+                             'be passed.')
+        if n_obs is None:
+            if t is None or dtype is None:
+                raise ValueError('`memory_budget` needs a bounded `t` and a '
+                                 '`dtype`.')
+            return cls.plan(obs_size, t, memory_budget, dtype, quantiles,
+                            nan_policy, background).n_obs
+        n_obs = int(n_obs) if np.isscalar(n_obs) else [int(n) for n in n_obs]
+        if np.size(n_obs) == 0 or np.min(n_obs) <= 1:
+            raise ValueError('`n_obs` of <= 1 does not make sense.')
+        return n_obs
+
+    def _init_arrs(self, dtype):
+        """Allocate the arrays for observations of data type `dtype`."""
+        self.dtype = np.dtype(dtype)
+        self.median_dtype = _median_dtype(self.dtype)
+
+        # Only the first array holds observations, all others hold medians
+        dtypes = [self.dtype] + [self.median_dtype] * (self.k_arrs - 1)
+        self.arrs = [self._alloc_arr(arr_i, s, d) for arr_i, (s, d)
+                     in enumerate(zip(self.k_arr_sizes, dtypes))]
+        self._init_n_valid()
+
+    def _init_n_valid(self):
+        """Allocate the numbers of valid observations for nan_policy='omit'.
+
+        Each value in the arrays above the first one gets the number of
+        valid observations it represents.
+        """
+        self._n_valid = None
+        if self.nan_policy == 'omit':
+            self._n_valid = [None] + [
+                np.zeros(self._arr_shape(size, arr_i), dtype=np.int64)
+                for arr_i, size in enumerate(self.k_arr_sizes[1:], 1)]
+
+    def _alloc_arr(self, arr_i, size, dtype):
+        """Allocate array `arr_i` in memory or in a memory-mapped file."""
+        shape = self._arr_shape(size, arr_i)
+        if self.spill_dir is None or arr_i < self.spill_from:
+            return np.zeros(shape, dtype=dtype)
+        # The file is already deleted, but stays available to the memory map
+        # until it is closed
+        with tempfile.TemporaryFile(dir=self.spill_dir) as fid:
+            return np.memmap(fid, dtype=dtype, mode='w+', shape=tuple(shape))
+
+    def _add_arr(self):
+        """Add another array on top of the existing ones."""
+        size = _level_size(self.n_obs, self.k_arrs)
+        self.k_arrs += 1
+        self.k_arr_sizes.append(size)
+        self._kernels.append(self._get_kernel(self.k_arrs - 1, size))
+        self.arrs.append(self._alloc_arr(self.k_arrs - 1, size,
+                                         self.median_dtype))
+        if self._n_valid is not None:
+            self._n_valid.append(np.zeros(
+                self._arr_shape(size, self.k_arrs - 1), dtype=np.int64))
+        self.obs_idx_counter.append(0)
+        self.modulos.append(self.modulos[-1] * size)
+
+    def _get_kernel(self, arr_i, size):
+        """Get the kernel to collapse array `arr_i` of `size` values."""
+        return get_kernel(self.kernel, size, self.layout,
+                          int(np.prod(self._obs_shape(arr_i))))
+
+    def _arr_shape(self, size, arr_i=0):
+        """Get the shape of array `arr_i` holding `size` observations."""
+        if self.layout == 'last':
+            return self._obs_shape(arr_i) + [size]
+        return [size] + self._obs_shape(arr_i)
+
+    def _obs_shape(self, arr_i):
+        """Get the shape of each value in array `arr_i`."""
+        if arr_i == 0 or self.quantiles is None:
+            return self.obs_size
+        return [len(self.quantiles)] + self.obs_size
+
+    def _slot(self, idx):
+        """Get the index of observation(s) `idx` within an array."""
+        if self.layout == 'last':
+            return (Ellipsis, idx)
+        return (idx, Ellipsis)
 
     def add_obs(self, obs):
         """Add an observation to the Remedian.
@@ -144,37 +663,1057 @@ class Remedian:
         if list(obs.shape) != self.obs_size:
             raise ValueError('Expected observation of size {} but received: '
                              '{}'.format(self.obs_size, list(obs.shape)))
-        if self.obs_count > (self.t - 1):
+        if self.t is not None and self.obs_count > (self.t - 1):
             raise RuntimeError('Already collected {} observations out of t={} '
                                'The remedian is {}'.format(self.obs_count,
                                                            self.t,
                                                            self.remedian))
 
         # We accept a new observation
+        if self.dtype is None:
+            self._init_arrs(obs.dtype)
         self.obs_count += 1
 
         # Add the data to the first array
         # and increment the counter for the next data
         obs_idx = self.obs_idx_counter[0]
-        self.arrs[0][..., obs_idx] = obs
+        self.arrs[0][self._slot(obs_idx)] = obs
         self.obs_idx_counter[0] += 1
+        if self.summary:
+            self._update_moments(obs)
+
+        if (self.background and
+                self.obs_idx_counter[0] == self.k_arr_sizes[0] and
+                (self.k_arrs > 1 or self.t is None)):
+            self._collapse_background()
+            if self.obs_count == self.t:
+                self.remedian = self.estimate(self.out)
+        else:
+            self._cascade()
+
+        if (self.checkpoint_every is not None and
+                self.obs_count % self.checkpoint_every == 0):
+            self.save(self.checkpoint_path)
+
+    def add_obs_batch(self, block, axis=-1):
+        """Add several observations to the Remedian at once.
+
+        The result is identical to calling :meth:`add_obs` on each
+        observation in `block` in order. However, all groups of `n_obs`
+        consecutive observations that would fill the first array are
+        collapsed at once, in tiles of elements on `n_jobs` threads and of at
+        most `block_bytes` like a single collapse, and the resulting medians
+        are passed on to the next array in the same way.
+        The remaining observations are copied into the arrays with one
+        vectorized assignment.
+
+        Parameters
+        ----------
+        block : ndarray
+            Several data observations stacked along `axis`. Removing `axis`
+            from the shape of `block` must result in `obs_size`.
+        axis : int
+            The axis of `block` along which the observations are stacked.
+            Defaults to the last axis.
+
+        """
+        block = np.moveaxis(np.asanyarray(block), axis, -1)
+        if list(block.shape[:-1]) != self.obs_size:
+            raise ValueError(f'Expected observations of size {self.obs_size} '
+                             f'but received: {list(block.shape[:-1])}')
+        n_block = block.shape[-1]
+        if self.t is not None and self.obs_count + n_block > self.t:
+            raise RuntimeError(f'Cannot add {n_block} observations: Already '
+                               f'collected {self.obs_count} observations out '
+                               f'of t={self.t}')
+
+        self.flush()
+        if self.dtype is None:
+            self._init_arrs(block.dtype)
 
+        n_before = self.obs_count
+        if self.summary and n_block:
+            block_mean = np.mean(block, axis=-1, dtype=np.float64)
+            self._combine_moments(
+                n_block, block_mean,
+                np.var(block, axis=-1, dtype=np.float64) * n_block,
+                np.min(block, axis=-1), np.max(block, axis=-1))
+        if self.layout == 'first':
+            block = np.moveaxis(block, -1, 0)
+        self._push_many(0, block)
+        self.obs_count += n_block
+
+        if self.obs_count == self.t:
+            self.remedian = self.estimate(self.out)
+
+        # Save a checkpoint if we passed a multiple of checkpoint_every
+        if (self.checkpoint_every is not None and
+                self.obs_count // self.checkpoint_every >
+                n_before // self.checkpoint_every):
+            self.save(self.checkpoint_path)
+
+    def _update_moments(self, obs):
+        """Update the summary statistics with a single observation."""
+        if self._moments is None:
+            self._combine_moments(1, obs.astype(np.float64),
+                                  np.zeros(obs.shape), obs, obs)
+            return
+        moments = self._moments
+        if self._moments_tmp is None:
+            self._moments_tmp = [np.empty(obs.shape) for _ in range(2)]
+        delta, tmp = self._moments_tmp
+        moments['count'] += 1
+        # Welford's algorithm without temporary arrays
+        np.subtract(obs, moments['mean'], out=delta)
+        np.divide(delta, moments['count'], out=tmp)
+        moments['mean'] += tmp
+        np.subtract(obs, moments['mean'], out=tmp)
+        tmp *= delta
+        moments['m2'] += tmp
+        np.minimum(moments['min'], obs, out=moments['min'])
+        np.maximum(moments['max'], obs, out=moments['max'])
+
+    def _combine_moments(self, count, mean, m2, min_, max_):
+        """Combine the summary statistics with those of other observations.
+
+        Uses the pairwise update of the mean and of the sum of squared
+        deviations `m2` by Chan et al.
+        """
+        moments = self._moments
+        if moments is None:
+            self._moments = {'count': count, 'mean': np.array(mean),
+                             'm2': np.array(m2),
+                             'min': np.array(min_, dtype=self.dtype),
+                             'max': np.array(max_, dtype=self.dtype)}
+            return
+        total = moments['count'] + count
+        delta = mean - moments['mean']
+        moments['m2'] += m2 + delta**2 * (moments['count'] * count / total)
+        moments['mean'] += delta * (count / total)
+        moments['count'] = total
+        np.minimum(moments['min'], min_, out=moments['min'])
+        np.maximum(moments['max'], max_, out=moments['max'])
+
+    def summarize(self):
+        """Get the remedian together with other summary statistics.
+
+        Requires ``summary=True``.
+
+        Returns
+        -------
+        summary : RemedianSummary
+            The remedian, or its estimate if not all `t` observations have
+            been added, together with the count, mean, variance, minimum
+            and maximum of the observations.
+
+        """
+        if not self.summary:
+            raise RuntimeError('No summary statistics available, pass '
+                               '`summary=True` to compute them.')
+        remedian = self.remedian
+        if remedian is None:
+            remedian = self.estimate()
+        moments = self._moments
+        return RemedianSummary(remedian, moments['count'],
+                               moments['mean'].copy(),
+                               moments['m2'] / moments['count'],
+                               moments['min'].copy(), moments['max'].copy())
+
+    def _cascade(self):
+        """Collapse all arrays that are full after the latest observation."""
         # We can notice whenever an array is full using modulo operations
         # on the observation counter self.obs_count.
         # When an array is full, calculate the median and put the result
         # into the next array. Then reset the counters and start filling
-        # previous arrays again
+        # previous arrays again. If an array is not full, no array above it
+        # can be full either.
         for arr_i, mod in enumerate(self.modulos):
-            if self.obs_count % mod == 0:
-                data = self.arrs[arr_i]
-                m_tmp = np.median(data, axis=-1, overwrite_input=True)
-                self.arrs[arr_i+1][..., self.obs_idx_counter[arr_i+1]] = m_tmp
-                self.obs_idx_counter[arr_i+1] += 1
-                self.obs_idx_counter[arr_i] = 0
+            if self.obs_count % mod != 0:
+                break
+            self._collapse(arr_i)
 
         # If all observations have been received,
         # calculate the median of the last array.
         # This is the robust approximation of the median
         if self.obs_count == self.t:
-            self.remedian = np.median(self.arrs[-1], axis=-1,
-                                      overwrite_input=True)
+            self.remedian = self.estimate(self.out)
+
+    def _collapse(self, arr_i, src=None):
+        """Put the median of the full array `arr_i` into the next array.
+
+        If `src` is not None, it holds the values of array `arr_i` instead,
+        and array `arr_i` is not emptied.
+        """
+        if arr_i + 1 == self.k_arrs:
+            # Only happens for an unbounded number of observations
+            self._add_arr()
+        next_idx = self.obs_idx_counter[arr_i+1]
+        if self.block_bytes is None and self._n_valid is None:
+            # Write the median straight into its slot of the next array
+            apply_kernel(self._kernels[arr_i],
+                         self.arrs[arr_i] if src is None else src,
+                         self._axis, self.arrs[arr_i+1][self._slot(next_idx)])
+        else:
+            self._collapse_tiles(arr_i, next_idx, src)
+        self.obs_idx_counter[arr_i+1] += 1
+        if src is None:
+            self.obs_idx_counter[arr_i] = 0
+
+    def _collapse_background(self):
+        """Swap the full first array with the spare one and collapse it."""
+        # Wait for the previous collapse, which also frees the spare array
+        self.flush()
+        if self._spare is None:
+            self._spare = self._alloc_arr(0, self.k_arr_sizes[0], self.dtype)
+        full = self.arrs[0]
+        self.arrs[0], self._spare = self._spare, full
+        self.obs_idx_counter[0] = 0
+        if self._worker is None:
+            self._worker = ThreadPoolExecutor(max_workers=1)
+        self._pending = self._worker.submit(self._cascade_from, full)
+
+    def _cascade_from(self, full):
+        """Collapse the values `full` of the first array and all full arrays.
+
+        Runs on the background thread, which is the only one to change the
+        arrays above the first one while a collapse is pending.
+        """
+        self._collapse(0, full)
+        arr_i = 1
+        while (arr_i + 1 < self.k_arrs or self.t is None) and \
+                self.obs_idx_counter[arr_i] == self.k_arr_sizes[arr_i]:
+            self._collapse(arr_i)
+            arr_i += 1
+
+    def flush(self):
+        """Wait until a pending collapse on the background thread is done.
+
+        Only has an effect with ``background=True``. Raises the exception of
+        the collapse if it failed.
+        """
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.result()
+
+    async def aadd_obs(self, obs):
+        """Add an observation to the Remedian from an :mod:`asyncio` task.
+
+        The same as :meth:`add_obs`, but if the observation has to wait for a
+        pending collapse on the background thread, the event loop can run
+        other tasks in the meantime.
+
+        Parameters
+        ----------
+        obs : ndarray, shape(obs_size)
+            A single data observation.
+
+        """
+        if self._pending is not None and (
+                self.obs_idx_counter[0] + 1 == self.k_arr_sizes[0] or
+                self.obs_count + 1 == self.t):
+            await asyncio.wrap_future(self._pending)
+        self.add_obs(obs)
+
+    async def aresult(self):
+        """Get the remedian from an :mod:`asyncio` task.
+
+        Waits for a pending collapse on the background thread without
+        blocking the event loop.
+
+        Returns
+        -------
+        remedian : ndarray, shape(obs_size)
+            The `remedian` if all `t` observations have been added, or the
+            result of :meth:`estimate` otherwise.
+
+        """
+        if self._pending is not None:
+            await asyncio.wrap_future(self._pending)
+        if self.remedian is not None:
+            return self.remedian
+        return self.estimate()
+
+    def _flat_arr(self, arr_i, arr=None):
+        """Get a view of array `arr_i` with all elements on one axis.
+
+        If `arr` is not None, it holds the values of array `arr_i` instead.
+        """
+        size = self.k_arr_sizes[arr_i]
+        if arr is None:
+            arr = self.arrs[arr_i]
+        if self.layout == 'last':
+            return arr.reshape(-1, size)
+        return arr.reshape(size, -1)
+
+    def _tiles(self, n_values, itemsize, n_elems=None):
+        """Split the elements into tiles of at most `block_bytes`.
+
+        Each element has `n_values` values of `itemsize` bytes. Defaults to
+        the elements of an observation.
+        """
+        if n_elems is None:
+            n_elems = int(np.prod(self.obs_size))
+        if self.block_bytes is None:
+            return [slice(0, n_elems)]
+        tile_size = max(1, min(self.block_bytes // (n_values * itemsize),
+                               -(-n_elems // self.n_jobs)))
+        return [slice(start, start + tile_size)
+                for start in range(0, n_elems, tile_size)]
+
+    def _collapse_tiles(self, arr_i, next_idx, src=None):
+        """Collapse array `arr_i` tile by tile, possibly on several threads.
+
+        If `src` is not None, it holds the values of array `arr_i` instead.
+        """
+        src = self._flat_arr(arr_i, src)
+        dest = self._flat_arr(arr_i+1)[self._slot(next_idx)]
+        if arr_i == 0 and self.quantiles is not None:
+            # One row of elements for each quantile
+            dest = dest.reshape(len(self.quantiles), -1)
+        kernel = self._kernels[arr_i]
+        if self._n_valid is not None:
+            src_n_valid = (None if arr_i == 0 else
+                           self._flat_arr(arr_i, self._n_valid[arr_i]))
+            dest_n_valid = self._flat_arr(
+                arr_i+1, self._n_valid[arr_i+1])[self._slot(next_idx)]
+
+        def collapse_tile(tile):
+            data = src[tile] if self.layout == 'last' else src[:, tile]
+            if self._n_valid is None:
+                apply_kernel(kernel, data, self._axis, dest[..., tile])
+                return
+            counts = None
+            if src_n_valid is not None:
+                counts = (src_n_valid[tile] if self.layout == 'last' else
+                          src_n_valid[:, tile])
+            dest[tile], dest_n_valid[tile] = nan_median(
+                data, self._axis, kernel, counts)
+
+        self._map_tiles(collapse_tile,
+                        self._tiles(self.k_arr_sizes[arr_i], src.itemsize,
+                                    src.size // self.k_arr_sizes[arr_i]))
+
+    def _map_tiles(self, func, tiles):
+        """Call `func` on each tile, on a thread pool if `n_jobs` > 1."""
+        if self.n_jobs == 1:
+            for tile in tiles:
+                func(tile)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.n_jobs)
+        # Consume the results to raise any exception of the threads
+        list(self._executor.map(func, tiles))
+
+    def _push_many(self, arr_i, values, n_valid=None):
+        """Put `values` into array `arr_i` and collapse all full arrays.
+
+        `values` are stacked along the observation axis of the layout. For
+        ``nan_policy='omit'`` and arrays above the first one, `n_valid` are
+        the numbers of valid observations of `values`.
+        """
+        n_values = values.shape[self._axis]
+        start = 0
+        while start < n_values:
+            while arr_i >= self.k_arrs:
+                self._add_arr()
+            size = self.k_arr_sizes[arr_i]
+            # The last array is never collapsed if t is known
+            can_collapse = arr_i + 1 < self.k_arrs or self.t is None
+            n_groups = (n_values - start) // size
+
+            if self.obs_idx_counter[arr_i] == 0 and can_collapse and n_groups:
+                # Collapse all complete groups at once
+                stop = start + n_groups * size
+                group_slot = self._slot(slice(start, stop))
+                medians, medians_n_valid = self._collapse_groups(
+                    arr_i, values[group_slot], n_groups,
+                    None if n_valid is None else n_valid[group_slot])
+                self._push_many(arr_i + 1, medians, medians_n_valid)
+                start = stop
+                continue
+
+            # Fill the array up to where it is full
+            obs_idx = self.obs_idx_counter[arr_i]
+            n_chunk = min(n_values - start, size - obs_idx)
+            self.arrs[arr_i][self._slot(slice(obs_idx, obs_idx+n_chunk))] = \
+                values[self._slot(slice(start, start+n_chunk))]
+            if n_valid is not None:
+                self._n_valid[arr_i][
+                    self._slot(slice(obs_idx, obs_idx+n_chunk))] = \
+                    n_valid[self._slot(slice(start, start+n_chunk))]
+            self.obs_idx_counter[arr_i] += n_chunk
+            start += n_chunk
+
+            collapse_i = arr_i
+            while (collapse_i + 1 < self.k_arrs or self.t is None) and \
+                    self.obs_idx_counter[collapse_i] == \
+                    self.k_arr_sizes[collapse_i]:
+                self._collapse(collapse_i)
+                collapse_i += 1
+
+    def _collapse_groups(self, arr_i, values, n_groups, n_valid=None):
+        """Get the medians of `n_groups` groups of values for array `arr_i`.
+
+        `values` are stacked along the observation axis of the layout. For
+        ``nan_policy='omit'``, `n_valid` are the numbers of valid
+        observations of `values` for arrays above the first one, and the
+        numbers of valid observations of the medians are returned as well.
+        Otherwise, None is returned instead. The groups are collapsed tile by
+        tile like in :meth:`_collapse_tiles`.
+        """
+        size = self.k_arr_sizes[arr_i]
+        to_quantiles = arr_i == 0 and self.quantiles is not None
+        if to_quantiles:
+            kernel = self._kernels[0]
+        else:
+            # Each comparator of a network covers all groups at once
+            kernel = get_kernel(self.kernel, size, 'first',
+                                int(np.prod(self._obs_shape(arr_i))) *
+                                n_groups)
+        kernel_axis = 0 if kernel is network_median else -1
+
+        # Views with the elements, then the groups, then the values of each
+        # group, and for the medians a leading quantile axis
+        values = self._elem_view(values, n_groups * size)
+        values = values.reshape(values.shape[:-1] + (n_groups, size))
+        if n_valid is not None:
+            n_valid = self._elem_view(n_valid, n_groups * size).reshape(
+                values.shape)
+        medians = np.empty(self._arr_shape(n_groups, arr_i + 1),
+                           dtype=self.median_dtype)
+        n_quantiles = len(self.quantiles) if to_quantiles else None
+        medians_view = self._elem_view(medians, n_groups, n_quantiles)
+        medians_n_valid = None
+        if self._n_valid is not None:
+            medians_n_valid = np.empty(medians.shape, dtype=np.int64)
+            n_valid_view = self._elem_view(medians_n_valid, n_groups)
+
+        def to_groups(values, tile, dtype):
+            # The values are copied such that the kernel works on contiguous
+            # memory: A network works on all values of one position within
+            # the groups at a time, a partition on all values of one group
+            values = np.moveaxis(values[tile], -1, kernel_axis)
+            groups = np.empty(values.shape, dtype=dtype)
+            groups[...] = values
+            return groups
+
+        def collapse_tile(tile):
+            groups = to_groups(values, tile, self.arrs[arr_i].dtype)
+            if medians_n_valid is None:
+                apply_kernel(kernel, groups, kernel_axis,
+                             medians_view[..., tile, :])
+                return
+            counts = (None if n_valid is None else
+                      to_groups(n_valid, tile, np.int64))
+            medians_view[tile], n_valid_view[tile] = nan_median(
+                groups, kernel_axis, kernel, counts)
+
+        self._map_tiles(collapse_tile, self._tiles(
+            n_groups * size, values.itemsize, values.shape[0]))
+        return medians, medians_n_valid
+
+    def _elem_view(self, arr, n, n_quantiles=None):
+        """View `arr` of `n` observations with the elements on one axis.
+
+        The observations are on the last axis. If `n_quantiles` is not None,
+        the quantile axis of the observations is kept as the first axis.
+        """
+        quantile_shape = [] if n_quantiles is None else [n_quantiles]
+        if self.layout == 'last':
+            return arr.reshape(quantile_shape + [-1, n])
+        return np.moveaxis(arr.reshape([n] + quantile_shape + [-1]), 0, -1)
+
+    def merge(self, other):
+        """Merge the observations of another Remedian into this one.
+
+        All values in the filled positions of the arrays of `other` are put
+        into the same arrays of this Remedian, collapsing arrays that become
+        full on the way. Because each value keeps the number of observations
+        it represents, the result is a valid state as if all observations had
+        been added to this Remedian, only grouped differently. This allows to
+        compute a Remedian on several parts of a data set in parallel, see
+        also :meth:`combine`.
+
+        Parameters
+        ----------
+        other : Remedian
+            The Remedian to merge into this one. Must have the same
+            `obs_size`, `n_obs`, `layout` and `quantiles`, and is not
+            changed.
+
+        Returns
+        -------
+        self : Remedian
+            This Remedian, after merging.
+
+        """
+        self.flush()
+        other.flush()
+        for attr in ('obs_size', 'n_obs', 'layout', 'quantiles', 'summary',
+                     'nan_policy'):
+            if getattr(self, attr) != getattr(other, attr):
+                raise ValueError(f'Cannot merge Remedian objects with '
+                                 f'different `{attr}`: {getattr(self, attr)} '
+                                 f'and {getattr(other, attr)}')
+        if other.obs_count == 0:
+            return self
+        if self.dtype is None:
+            self._init_arrs(other.dtype)
+        elif self.dtype != other.dtype:
+            raise ValueError(f'Cannot merge Remedian objects with different '
+                             f'`dtype`: {self.dtype} and {other.dtype}')
+        n_total = self.obs_count + other.obs_count
+        if self.t is not None and n_total > self.t:
+            raise RuntimeError(f'Cannot merge {other.obs_count} observations: '
+                               f'Already collected {self.obs_count} '
+                               f'observations out of t={self.t}')
+
+        for arr_i, n_filled in enumerate(other.obs_idx_counter):
+            filled = other._slot(slice(0, n_filled))
+            self._push_many(arr_i, other.arrs[arr_i][filled],
+                            None if arr_i == 0 or other._n_valid is None else
+                            other._n_valid[arr_i][filled])
+        if self.summary:
+            self._combine_moments(*other._moments.values())
+        self.obs_count = n_total
+
+        if self.obs_count == self.t:
+            self.remedian = self.estimate(self.out)
+        return self
+
+    @classmethod
+    def combine(cls, remedians):
+        """Combine several Remedian objects into a new one.
+
+        Parameters
+        ----------
+        remedians : list of Remedian
+            The Remedian objects to combine, for example computed on
+            different parts of a data set. See :meth:`merge` for the
+            requirements.
+
+        Returns
+        -------
+        combined : Remedian
+            A new Remedian with all observations. Its `t` is the sum of the
+            `t` of `remedians`, or None if any of them is None.
+
+        """
+        first = remedians[0]
+        ts = [rem.t for rem in remedians]
+        t = None if None in ts else sum(ts)
+        combined = cls(first.obs_size, first.n_obs, t, layout=first.layout,
+                       dtype=first.dtype, kernel=first.kernel,
+                       quantiles=first.quantiles, summary=first.summary,
+                       nan_policy=first.nan_policy)
+        for rem in remedians:
+            combined.merge(rem)
+        return combined
+
+    def __getstate__(self):
+        """Get the state for pickling, without unfilled array positions."""
+        self.flush()
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_worker'] = None
+        state['_spare'] = None
+        # Drop the timed versions of methods
+        for name in _INSTRUMENTED:
+            state.pop(name, None)
+        state['arrs'] = [arr[self._slot(slice(0, n_filled))].copy()
+                         for arr, n_filled in zip(self.arrs,
+                                                  self.obs_idx_counter)]
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state from pickling."""
+        filled = state.pop('arrs')
+        self.__dict__.update(state)
+        self.arrs = []
+        for arr_i, (size, arr_filled) in enumerate(zip(self.k_arr_sizes,
+                                                        filled)):
+            arr = self._alloc_arr(arr_i, size, arr_filled.dtype)
+            arr[self._slot(slice(0, arr_filled.shape[self._axis]))] = \
+                arr_filled
+            self.arrs.append(arr)
+        if self.instrument:
+            self._instrument()
+
+    def _instrument(self):
+        """Replace some methods by versions that measure their duration."""
+        stats = self._stats
+        collapse = self._collapse
+
+        collapse_groups = self._collapse_groups
+
+        def record_collapses(arr_i, n_collapses, duration):
+            for key, init in [('collapse_count', 0), ('collapse_time', 0.),
+                              ('collapse_max_time', 0.)]:
+                stats[key] += [init] * (arr_i + 1 - len(stats[key]))
+            stats['collapse_count'][arr_i] += n_collapses
+            stats['collapse_time'][arr_i] += duration
+            # Collapses of several groups at once count as equally long
+            duration /= n_collapses
+            stats['collapse_max_time'][arr_i] = max(
+                stats['collapse_max_time'][arr_i], duration)
+            if self.on_collapse is not None:
+                for _ in range(n_collapses):
+                    self.on_collapse(arr_i, duration)
+
+        def timed_collapse(arr_i, src=None):
+            start = timer()
+            collapse(arr_i, src)
+            record_collapses(arr_i, 1, timer() - start)
+
+        def timed_collapse_groups(arr_i, values, n_groups, n_valid=None):
+            start = timer()
+            medians = collapse_groups(arr_i, values, n_groups, n_valid)
+            record_collapses(arr_i, n_groups, timer() - start)
+            return medians
+
+        def timed(method, key):
+            def timed_method(*args, **kwargs):
+                start = timer()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    stats[key] += timer() - start
+            timed_method.__doc__ = method.__doc__
+            return timed_method
+
+        self._collapse = timed_collapse
+        self._collapse_groups = timed_collapse_groups
+        self.add_obs = timed(self.add_obs, 'ingest_time')
+        self.add_obs_batch = timed(self.add_obs_batch, 'ingest_time')
+        self.estimate = timed(self.estimate, 'estimate_time')
+
+    @property
+    def stats(self):
+        """Get a snapshot of the measurements, see the class docstring."""
+        if not self.instrument:
+            raise RuntimeError('No measurements available, pass '
+                               '`instrument=True` to measure.')
+        stats = {key: list(value) if isinstance(value, list) else value
+                 for key, value in self._stats.items()}
+        stats['obs_count'] = self.obs_count
+        stats['obs_per_sec'] = (self.obs_count / stats['ingest_time']
+                                if stats['ingest_time'] else 0.)
+        # Arrays that were never collapsed
+        for key, init in [('collapse_count', 0), ('collapse_time', 0.),
+                          ('collapse_max_time', 0.)]:
+            stats[key] += [init] * (self.k_arrs - len(stats[key]))
+        stats['resident_bytes'] = [
+            0 if isinstance(arr, np.memmap) else arr.nbytes
+            for arr in self.arrs]
+        return stats
+
+    def save(self, fname):
+        """Save the state of the Remedian to a directory.
+
+        The directory contains a ``state.json`` file with the parameters and
+        counters, and one ``arr_<i>.npy`` file with the filled part of each
+        array. The state is first written to ``<fname>.tmp`` and then moved
+        to `fname`, so that an existing checkpoint is only replaced by a
+        complete one. The existing checkpoint is moved to ``<fname>.old``
+        meanwhile, which :meth:`load` falls back to if saving was interrupted
+        in between.
+
+        Parameters
+        ----------
+        fname : path-like
+            The directory to save to. Is overwritten if it exists.
+
+        See Also
+        --------
+        load
+
+        """
+        self.flush()
+        fname = os.fspath(fname)
+        tmp_fname = fname + '.tmp'
+        if os.path.exists(tmp_fname):
+            shutil.rmtree(tmp_fname)
+        os.makedirs(tmp_fname)
+
+        state = {attr: getattr(self, attr) for attr in _SAVED_ATTRS}
+        state['dtype'] = None if self.dtype is None else self.dtype.str
+        # A callable kernel has to be passed again when loading
+        if callable(self.kernel):
+            state['kernel'] = None
+        with open(os.path.join(tmp_fname, 'state.json'), 'w') as fout:
+            json.dump(state, fout)
+
+        # There are no arrays yet if the data type is not known
+        for arr_i, (arr, n_filled) in enumerate(zip(self.arrs,
+                                                    self.obs_idx_counter)):
+            filled = arr[self._slot(slice(0, n_filled))]
+            np.save(os.path.join(tmp_fname, f'arr_{arr_i}.npy'), filled)
+        if self.remedian is not None:
+            np.save(os.path.join(tmp_fname, 'remedian.npy'), self.remedian)
+        if self._moments is not None:
+            np.savez(os.path.join(tmp_fname, 'moments.npz'), **self._moments)
+        if self._n_valid is not None:
+            for arr_i, n_filled in enumerate(self.obs_idx_counter[1:], 1):
+                np.save(os.path.join(tmp_fname, f'n_valid_{arr_i}.npy'),
+                        self._n_valid[arr_i][self._slot(slice(0, n_filled))])
+
+        _replace_dir(tmp_fname, fname)
+
+    @classmethod
+    def load(cls, fname, mmap_mode=None, **kwargs):
+        """Load a Remedian that was saved with :meth:`save`.
+
+        Parameters
+        ----------
+        fname : path-like
+            The directory the Remedian was saved to. If it does not exist
+            because saving was interrupted, the previous state in
+            ``<fname>.old`` is loaded instead.
+        mmap_mode : None | str
+            If not None, the saved arrays are memory-mapped with this mode
+            (see :func:`numpy.load`) while they are copied into the arrays of
+            the Remedian, instead of being read into memory at once.
+        **kwargs : dict
+            Parameters of :class:`Remedian` that override the saved ones,
+            for example `spill_dir` or `n_jobs`. A `kernel` must be passed
+            if the saved Remedian used a callable kernel.
+
+        Returns
+        -------
+        remedian : Remedian
+            The loaded Remedian, which can take more observations.
+
+        """
+        fname = os.fspath(fname)
+        if not os.path.exists(fname) and os.path.exists(fname + '.old'):
+            fname = fname + '.old'
+        with open(os.path.join(fname, 'state.json')) as fin:
+            state = json.load(fin)
+
+        params = {attr: state[attr] for attr in _SAVED_PARAMS}
+        params.update(kwargs)
+        if params['kernel'] is None:
+            raise ValueError('The Remedian was saved with a callable kernel, '
+                             'please pass it as `kernel`.')
+        rem = cls(state['obs_size'], state['n_obs'], state['t'], **params)
+        while rem.k_arrs < state['k_arrs']:
+            rem._add_arr()
+
+        for arr_i, n_filled in enumerate(
+                state['obs_idx_counter'][:len(rem.arrs)]):
+            filled = np.load(os.path.join(fname, f'arr_{arr_i}.npy'),
+                             mmap_mode=mmap_mode)
+            rem.arrs[arr_i][rem._slot(slice(0, n_filled))] = filled
+            if rem._n_valid is not None and arr_i > 0:
+                rem._n_valid[arr_i][rem._slot(slice(0, n_filled))] = np.load(
+                    os.path.join(fname, f'n_valid_{arr_i}.npy'))
+        rem.obs_idx_counter = state['obs_idx_counter']
+        rem.obs_count = state['obs_count']
+        if os.path.exists(os.path.join(fname, 'remedian.npy')):
+            rem.remedian = np.load(os.path.join(fname, 'remedian.npy'))
+        if os.path.exists(os.path.join(fname, 'moments.npz')):
+            with np.load(os.path.join(fname, 'moments.npz')) as moments:
+                rem._combine_moments(
+                    int(moments['count']), moments['mean'], moments['m2'],
+                    moments['min'], moments['max'])
+        return rem
+
+    def estimate(self, out=None):
+        """Estimate the remedian from the observations added so far.
+
+        The estimate is the weighted median of all values in the filled
+        positions of all arrays, see the Notes of :class:`Remedian`. The
+        arrays are not changed, so that more observations can be added
+        afterwards.
+
+        If `quantiles` is not None, the observations in the first array are
+        not weighted one by one. Instead, the quantiles of all of them are
+        weighted by their number, and the estimate of each quantile is the
+        weighted median of its estimates in all arrays.
+
+        Parameters
+        ----------
+        out : None | ndarray
+            If not None, the C-contiguous array of the shape of the estimate
+            to write the estimate into.
+
+        Returns
+        -------
+        estimate : ndarray, shape(obs_size)
+            The current approximation of the median, with a leading quantile
+            axis if `quantiles` is not None. This is `out` if it was passed.
+
+        """
+        if self.obs_count == 0:
+            raise RuntimeError('Cannot estimate the remedian before any '
+                               'observation has been added.')
+        self.flush()
+        estimate = self._check_out(out)
+        if self.quantiles is not None:
+            return self._estimate_quantiles(estimate)
+
+        weights = []
+        for arr_i, n_filled in enumerate(self.obs_idx_counter):
+            # Each value represents as many observations as fit into all
+            # arrays below it
+            weight = 1 if arr_i == 0 else self.modulos[arr_i-1]
+            weights.append(np.full(n_filled, weight, dtype=np.int64))
+        weights = np.concatenate(weights)
+
+        # Go through the elements in blocks to bound the memory, with all
+        # values of an element along the last axis
+        def gather(flat_arrs, tile, dtype):
+            values = []
+            for flat_arr, n_filled in zip(flat_arrs, self.obs_idx_counter):
+                if self.layout == 'last':
+                    values.append(flat_arr[tile, :n_filled])
+                else:
+                    values.append(flat_arr[:n_filled, tile].T)
+            return np.concatenate([value.astype(dtype, copy=False)
+                                   for value in values], axis=-1)
+
+        flat_arrs = [self._flat_arr(arr_i) for arr_i in range(self.k_arrs)]
+        if self._n_valid is not None:
+            # Each observation in the first array is valid unless it is NaN
+            flat_n_valid = [np.ones_like(flat_arrs[0], dtype=np.int64)] + [
+                self._flat_arr(arr_i, self._n_valid[arr_i])
+                for arr_i in range(1, self.k_arrs)]
+        flat_estimate = estimate.reshape(-1)
+        for tile in self._tiles(len(weights), estimate.itemsize):
+            values = gather(flat_arrs, tile, self.median_dtype)
+            if self._n_valid is None:
+                flat_estimate[tile] = weighted_median(values, weights)
+            else:
+                flat_estimate[tile], _ = nan_weighted_median(
+                    values, gather(flat_n_valid, tile, np.int64))
+        return estimate
+
+    def _check_out(self, out):
+        """Check the array `out` for the estimate, or allocate a new one."""
+        shape = list(self.obs_size)
+        if self.quantiles is not None:
+            shape.insert(0, len(self.quantiles))
+        if out is None:
+            return np.empty(shape, dtype=self.median_dtype)
+        if list(out.shape) != shape:
+            raise ValueError(f'Expected `out` of shape {shape} but got: '
+                             f'{list(out.shape)}')
+        if not out.flags.c_contiguous:
+            raise ValueError('`out` must be C-contiguous.')
+        return out
+
+    def _estimate_quantiles(self, estimate):
+        """Estimate the quantiles from the observations added so far.
+
+        The estimate is written into the array `estimate`.
+        """
+        n_quantiles = len(self.quantiles)
+        n_elems = int(np.prod(self.obs_size))
+        n_first = self.obs_idx_counter[0]
+        weights = [np.full(min(n_first, 1), n_first, dtype=np.int64)]
+        for arr_i, n_filled in enumerate(self.obs_idx_counter[1:], 1):
+            weights.append(np.full(n_filled, self.modulos[arr_i-1],
+                                   dtype=np.int64))
+        weights = np.concatenate(weights)
+
+        # All values of an element along the last axis, and for the higher
+        # arrays each quantile along the first axis
+        flat_arrs = [self._flat_arr(0)]
+        for arr_i in range(1, self.k_arrs):
+            size = self.k_arr_sizes[arr_i]
+            if self.layout == 'last':
+                flat_arrs.append(
+                    self.arrs[arr_i].reshape(n_quantiles, n_elems, size))
+            else:
+                flat_arrs.append(np.moveaxis(
+                    self.arrs[arr_i].reshape(size, n_quantiles, n_elems),
+                    0, -1))
+        flat_estimate = estimate.reshape(n_quantiles, n_elems)
+        for tile in self._tiles(len(weights) * n_quantiles,
+                                estimate.itemsize):
+            values = []
+            if n_first:
+                first = flat_arrs[0]
+                first = (first[tile, :n_first] if self.layout == 'last' else
+                         first[:n_first, tile].T)
+                # Copy, because the partition changes the order
+                values.append(self._kernels[0](first.copy(), -1)[..., None])
+            for flat_arr, n_filled in zip(flat_arrs[1:],
+                                          self.obs_idx_counter[1:]):
+                values.append(flat_arr[:, tile, :n_filled])
+            values = np.concatenate(
+                [value.astype(self.median_dtype, copy=False)
+                 for value in values], axis=-1)
+            flat_estimate[:, tile] = weighted_median(values, weights)
+        return estimate
+
+    def finalize(self, out=None):
+        """Stop adding observations and calculate the remedian.
+
+        Sets the `remedian` attribute to the result of :meth:`estimate` and
+        `t` to the number of observations added so far.
+
+        Parameters
+        ----------
+        out : None | ndarray
+            The array to write the remedian into, see :meth:`estimate`.
+            Defaults to the `out` passed to :class:`Remedian`.
+
+        Returns
+        -------
+        remedian : ndarray, shape(obs_size)
+            The approximation of the median.
+
+        """
+        self.remedian = self.estimate(self.out if out is None else out)
+        self.t = self.obs_count
+        return self.remedian
+
+    def reset(self):
+        """Remove all observations to start over with the same arrays.
+
+        The state is the same as the one of a new Remedian with the same
+        parameters, but the arrays are re-used instead of allocated again.
+        Their old values do not need to be cleared, because only the filled
+        positions of each array are ever read. `remedian` is set to None and
+        `t` to its initial value, while `out` is kept, so that it is
+        overwritten by the next remedian. The arrays keep their data type:
+        If it was inferred from the first observation with ``dtype=None``,
+        `dtype` and `median_dtype` are kept as well, unlike for a new
+        Remedian.
+        """
+        self.flush()
+        self.t = self._t_init
+        self.obs_count = 0
+        self.obs_idx_counter = [0 for arr in range(self.k_arrs)]
+        self.remedian = None
+        self._moments = None
+        if self.instrument:
+            # Update the dict in place, because the timed methods refer to it
+            self._stats.update({'ingest_time': 0., 'estimate_time': 0.,
+                                'collapse_count': [], 'collapse_time': [],
+                                'collapse_max_time': []})
+
+
+def _replace_dir(src, dst):
+    """Move the directory `src` to `dst`, keeping `dst` in ``<dst>.old``.
+
+    The old `dst` is only removed once `src` is in place.
+    """
+    old_dst = dst + '.old'
+    if os.path.exists(dst):
+        if os.path.exists(old_dst):
+            # Left over from an interrupted save
+            shutil.rmtree(old_dst)
+        os.replace(dst, old_dst)
+    os.replace(src, dst)
+    if os.path.exists(old_dst):
+        shutil.rmtree(old_dst)
+
+
+def _check_nan_policy(nan_policy, quantiles):
+    """Check the policy to handle NaN."""
+    if nan_policy not in ('propagate', 'omit'):
+        raise ValueError('`nan_policy` must be one of "propagate" or "omit", '
+                         f'but got: {nan_policy}')
+    if nan_policy == 'omit' and quantiles is not None:
+        raise ValueError('`nan_policy="omit"` cannot be combined with '
+                         '`quantiles`.')
+    return nan_policy
+
+
+def _check_quantiles(quantiles):
+    """Check the quantiles to estimate and convert them to a list."""
+    if quantiles is None:
+        return None
+    quantiles = [float(quantile) for quantile in quantiles]
+    if not quantiles or not all(0 <= quantile <= 1 for quantile in quantiles):
+        raise ValueError('`quantiles` must be a non-empty sequence of values '
+                         f'between 0 and 1, but got: {quantiles}')
+    return quantiles
+
+
+def _median_dtype(dtype):
+    """Get the data type of the medians of observations of type `dtype`."""
+    if np.issubdtype(dtype, np.inexact):
+        return np.dtype(dtype)
+    # Medians of medians of integers need more bits than a float16 has
+    return np.result_type(dtype, np.float32)
+
+
+def _level_size(n_obs, arr_i):
+    """Get the number of observations in array `arr_i`."""
+    if np.isscalar(n_obs):
+        return n_obs
+    return n_obs[min(arr_i, len(n_obs) - 1)]
+
+
+def _calc_arr_sizes(n_obs, t):
+    """Calculate the size of each array to accommodate `t` observations."""
+    k_arr_sizes = []
+    # The number of observations represented by all full arrays so far
+    n_below = 1
+    while n_below * _level_size(n_obs, len(k_arr_sizes)) <= t:
+        k_arr_sizes.append(_level_size(n_obs, len(k_arr_sizes)))
+        n_below *= k_arr_sizes[-1]
+    # The last array only needs to hold the remaining observations
+    k_arr_sizes.append(-(-t // n_below))
+    return k_arr_sizes
+
+
+def _iroot(t, k):
+    """Get the largest integer n with n**k <= t."""
+    n = int(round(t**(1 / k)))
+    while n**k > t:
+        n -= 1
+    while (n + 1)**k <= t:
+        n += 1
+    return n
+
+
+def compute_remedian(data, n_obs, axis=-1, read_bytes=2**26, **kwargs):
+    """Compute the remedian of an array along an axis.
+
+    This gives the same result as adding all observations along `axis` one
+    after another to a :class:`Remedian` with ``t=data.shape[axis]``, but
+    each array of the Remedian is collapsed in a few vectorized passes, see
+    :meth:`Remedian.add_obs_batch`. The data is read in blocks along `axis`,
+    so that a memory-mapped array is never loaded into memory at once.
+
+    Parameters
+    ----------
+    data : ndarray | path-like
+        The data, or the path to a ``.npy`` file that is memory-mapped.
+    n_obs : int | sequence of int
+        The number of observations to be stored within each array, see
+        :class:`Remedian`.
+    axis : int
+        The axis along which to compute the remedian. Defaults to the last
+        axis.
+    read_bytes : int
+        The approximate number of bytes of `data` read at once.
+    **kwargs : dict
+        Further parameters passed to :class:`Remedian`, for example
+        `block_bytes` to bound the memory of each collapse.
+
+    Returns
+    -------
+    remedian : ndarray
+        The remedian, with the shape of `data` without `axis`, and with a
+        leading quantile axis if `quantiles` is passed.
+
+    """
+    if isinstance(data, (str, os.PathLike)):
+        data = np.load(data, mmap_mode='r')
+    data = np.moveaxis(data, axis, -1)
+    t = data.shape[-1]
+    rem = Remedian(data.shape[:-1], n_obs, t, **kwargs)
+
+    # Read whole groups of the first array at a time if possible
+    obs_bytes = max(1, data[..., 0].nbytes)
+    block_size = max(1, read_bytes // obs_bytes)
+    if block_size > rem.modulos[0]:
+        block_size -= block_size % rem.modulos[0]
+    for start in range(0, t, block_size):
+        rem.add_obs_batch(data[..., start:start+block_size])
+    return rem.remedian
@@ -0,0 +1,201 @@
+"""Contains a Remedian for streams of scalar values."""
+
+# License: MIT
+
+import math
+from array import array
+
+import numpy as np
+
+from remedian._kernels import get_kernel, network_median, weighted_median
+from remedian.remedian import _level_size
+
+
+class ScalarRemedian:
+    """Remedian of a stream of scalar values, such as latencies.
+
+    Gives the same result as a :class:`Remedian` with ``obs_size=(1,)`` and
+    ``t=None``, but without the overhead of NumPy for every single value:
+    The arrays are compact buffers of doubles, a single value is added with
+    plain Python operations, and a full array is collapsed by sorting its few
+    values in Python. Many values at once are added with vectorized
+    operations, see :meth:`add_obs_batch`.
+
+    Parameters
+    ----------
+    n_obs : int | sequence of int
+        The number of values to be stored within each array, see
+        :class:`Remedian`.
+
+    Attributes
+    ----------
+    obs_count : int
+        The number of values added so far.
+    k_arrs : int
+        The current number of arrays.
+    remedian : None | float
+        The remedian, which is None until :meth:`finalize` is called.
+
+    """
+
+    def __init__(self, n_obs):
+        """Initialize the ScalarRemedian object.
+
+        See class docstring for more thorough information.
+
+        Parameters
+        ----------
+        n_obs : int | sequence of int
+            Values per array.
+
+        """
+        if np.size(n_obs) == 0 or np.min(n_obs) <= 1:
+            raise ValueError('`n_obs` of <= 1 does not make sense.')
+        self.n_obs = n_obs if np.isscalar(n_obs) else [int(n) for n in n_obs]
+        self.obs_count = 0
+        self.remedian = None
+        self.k_arrs = 0
+        self.k_arr_sizes = []
+        self.obs_idx_counter = []
+        # The buffers, and NumPy views of the same memory
+        self._bufs = []
+        self._views = []
+        # The number of values represented by each value of each array
+        self._weights = []
+        self._add_arr()
+
+    def _add_arr(self):
+        """Add another array on top of the existing ones."""
+        size = _level_size(self.n_obs, self.k_arrs)
+        weight = (1 if self.k_arrs == 0 else
+                  self._weights[-1] * self.k_arr_sizes[-1])
+        self.k_arrs += 1
+        self.k_arr_sizes.append(size)
+        self.obs_idx_counter.append(0)
+        buf = array('d', bytes(8 * size))
+        self._bufs.append(buf)
+        self._views.append(np.frombuffer(buf, dtype=np.float64))
+        self._weights.append(weight)
+
+    def add_obs(self, value):
+        """Add a single value.
+
+        Parameters
+        ----------
+        value : float
+            The value.
+
+        """
+        self.obs_count += 1
+        arr_i = 0
+        while True:
+            idx = self.obs_idx_counter[arr_i]
+            self._bufs[arr_i][idx] = value
+            if idx + 1 < self.k_arr_sizes[arr_i]:
+                self.obs_idx_counter[arr_i] = idx + 1
+                return
+            # The array is full, pass its median on to the next one
+            value = self._collapse(arr_i)
+            arr_i += 1
+            if arr_i == self.k_arrs:
+                self._add_arr()
+
+    def _collapse(self, arr_i):
+        """Get the median of the full array `arr_i` and empty it."""
+        buf = self._bufs[arr_i]
+        self.obs_idx_counter[arr_i] = 0
+        if any(map(math.isnan, buf)):
+            return math.nan
+        values = sorted(buf)
+        n = len(values)
+        if n % 2 == 1:
+            return values[n // 2]
+        return (values[n // 2 - 1] + values[n // 2]) / 2
+
+    def add_obs_batch(self, values):
+        """Add many values at once.
+
+        The result is identical to calling :meth:`add_obs` on each value in
+        order. However, all groups of values that would fill the first array
+        are collapsed at once with a single call of a median kernel, and so
+        on for the next arrays, see :meth:`Remedian.add_obs_batch`.
+
+        Parameters
+        ----------
+        values : ndarray, shape(n_values) | iterable of float
+            The values.
+
+        """
+        if isinstance(values, np.ndarray):
+            values = values.astype(np.float64, copy=False).reshape(-1)
+        else:
+            values = np.fromiter(values, dtype=np.float64)
+        self._push_many(0, values)
+        self.obs_count += len(values)
+
+    def _push_many(self, arr_i, values):
+        """Put `values` into array `arr_i` and collapse all full arrays."""
+        start = 0
+        while start < len(values):
+            if arr_i == self.k_arrs:
+                self._add_arr()
+            size = self.k_arr_sizes[arr_i]
+            idx = self.obs_idx_counter[arr_i]
+            n_groups = (len(values) - start) // size
+
+            if idx == 0 and n_groups:
+                # Collapse all complete groups at once, with the values of
+                # each group along the axis that suits the kernel
+                stop = start + n_groups * size
+                kernel = get_kernel('auto', size, 'first', n_groups)
+                groups = values[start:stop].reshape(n_groups, size)
+                if kernel is network_median:
+                    medians = kernel(groups.T.copy(), 0)
+                else:
+                    medians = kernel(groups.copy(), -1)
+                self._push_many(arr_i + 1, medians)
+                start = stop
+                continue
+
+            # Fill the array up to where it is full
+            n_chunk = min(len(values) - start, size - idx)
+            self._views[arr_i][idx:idx+n_chunk] = values[start:start+n_chunk]
+            self.obs_idx_counter[arr_i] = idx + n_chunk
+            start += n_chunk
+            if idx + n_chunk == size:
+                self._push_many(arr_i + 1,
+                                np.array([self._collapse(arr_i)]))
+
+    def estimate(self):
+        """Estimate the remedian from the values added so far.
+
+        The estimate is the weighted median of all values in the filled
+        positions of all arrays, see :meth:`Remedian.estimate`.
+
+        Returns
+        -------
+        estimate : float
+            The current approximation of the median.
+
+        """
+        if self.obs_count == 0:
+            raise RuntimeError('Cannot estimate the remedian before any '
+                               'observation has been added.')
+        values = np.concatenate([view[:n_filled] for view, n_filled
+                                 in zip(self._views, self.obs_idx_counter)])
+        weights = np.concatenate([
+            np.full(n_filled, weight, dtype=np.int64) for n_filled, weight
+            in zip(self.obs_idx_counter, self._weights)])
+        return float(weighted_median(values, weights))
+
+    def finalize(self):
+        """Stop adding values and calculate the remedian.
+
+        Returns
+        -------
+        remedian : float
+            The approximation of the median.
+
+        """
+        self.remedian = self.estimate()
+        return self.remedian
@@ -0,0 +1,66 @@
+"""Tests for the RemedianBank class."""
+import numpy as np
+import pytest
+
+from remedian import Remedian, RemedianBank
+
+
+@pytest.mark.parametrize('obs_size', [(), (2, 3)])
+@pytest.mark.parametrize('n_obs', [3, [4, 2]])
+def test_bank(obs_size, n_obs):
+    """Test that each group equals its own Remedian."""
+    n_groups = 6
+    rng = np.random.default_rng(11)
+    bank = RemedianBank(n_groups, n_obs, obs_size)
+    rems = [Remedian(obs_size or (1,), n_obs, None) for _ in range(n_groups)]
+
+    # Calls with many observations of few groups and the other way around,
+    # and one group that never gets any observation
+    for n_values, max_group in ((200, 2), (50, 5), (7, 5), (0, 5)):
+        group_ids = rng.integers(max_group, size=n_values)
+        values = rng.normal(size=(n_values,) + obs_size)
+        values[rng.random(n_values) < 0.2] = 1.5
+        bank.add_obs(group_ids, values)
+        for group_id, value in zip(group_ids, values):
+            rems[group_id].add_obs(np.reshape(value, obs_size or (1,)))
+
+        estimate = bank.estimate()
+        assert estimate.shape == (n_groups,) + obs_size
+        for group_id, rem in enumerate(rems):
+            assert bank.obs_count[group_id] == rem.obs_count
+            if rem.obs_count == 0:
+                assert np.all(np.isnan(estimate[group_id]))
+                continue
+            np.testing.assert_array_equal(
+                estimate[group_id], rem.estimate().reshape(obs_size))
+    assert bank.k_arrs == max(rem.k_arrs for rem in rems)
+
+    with pytest.raises(ValueError, match='Expected values of shape'):
+        bank.add_obs([0, 1], np.zeros((3,) + obs_size))
+    with pytest.raises(ValueError, match='Group ids must be'):
+        bank.add_obs([n_groups], np.zeros((1,) + obs_size))
+    with pytest.raises(ValueError, match='does not make sense'):
+        RemedianBank(n_groups, 1)
+
+
+def test_bank_many_obs():
+    """Test thousands of observations of one group in a single call."""
+    rng = np.random.default_rng(12)
+    bank = RemedianBank(3, 3)
+    rems = [Remedian((1,), 3, None) for _ in range(3)]
+
+    # A partly filled array first, then a long run of one group next to a
+    # few observations of another
+    for group_ids in ([0, 0, 1], [0] * 5000 + [2] * 4, [0] * 2):
+        group_ids = rng.permutation(group_ids)
+        values = rng.normal(size=len(group_ids))
+        bank.add_obs(group_ids, values)
+        for group_id, value in zip(group_ids, values):
+            rems[group_id].add_obs(np.array([value]))
+
+    estimate = bank.estimate()
+    for group_id, rem in enumerate(rems):
+        assert bank.obs_count[group_id] == rem.obs_count
+        np.testing.assert_array_equal(estimate[group_id],
+                                      rem.estimate()[0])
+    assert bank.k_arrs == rems[0].k_arrs
@@ -0,0 +1,61 @@
+"""Tests for the command line interface."""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import remedian.remedian
+from remedian import compute_remedian
+from remedian.__main__ import main
+
+
+def test_main(tmp_path, capsys, monkeypatch):
+    """Test computing the remedian of .npy files."""
+    rng = np.random.default_rng(4)
+    data = rng.normal(size=(30, 4, 5))
+    expected = compute_remedian(data, 4, axis=0)
+
+    # Observations stacked in files, read in small blocks
+    np.save(tmp_path / 'part_0.npy', data[:12])
+    np.save(tmp_path / 'part_1.npy', data[12:])
+    out = tmp_path / 'out.npy'
+    assert main([str(tmp_path / 'part_*.npy'), '--axis', '0', '--n-obs',
+                 '4', '--out', str(out), '--block-bytes', '500']) == 0
+    np.testing.assert_array_equal(np.load(out), expected)
+    assert '30 observations of shape (4, 5) from 2 file(s)' in \
+        capsys.readouterr().err
+
+    # One observation per file in a directory
+    obs_dir = tmp_path / 'obs'
+    obs_dir.mkdir()
+    for obs_i, obs in enumerate(data):
+        np.save(obs_dir / f'obs_{obs_i:02}.npy', obs)
+    main([str(obs_dir), '--n-obs', '4', '--out', str(out), '--quiet',
+          '--block-bytes', '1000'])
+    np.testing.assert_array_equal(np.load(out), expected)
+    assert capsys.readouterr().err == ''
+
+    main([str(obs_dir), '--n-obs', '3', '5', '--quantiles', '0.1', '0.9',
+          '--out', str(out), '--quiet'])
+    np.testing.assert_array_equal(
+        np.load(out),
+        compute_remedian(data, [3, 5], axis=0, quantiles=[0.1, 0.9]))
+
+    # The collapses run on a thread pool
+    executors = []
+    monkeypatch.setattr(remedian.remedian, 'ThreadPoolExecutor',
+                        lambda max_workers: executors.append(max_workers) or
+                        ThreadPoolExecutor(max_workers))
+    main([str(obs_dir), '--n-obs', '4', '--out', str(out), '--quiet',
+          '--n-jobs', '2'])
+    assert executors == [2]
+    np.testing.assert_array_equal(np.load(out), expected)
+
+    with pytest.raises(FileNotFoundError, match='No files found'):
+        main([str(tmp_path / 'missing_*.npy'), '--n-obs', '3', '--out',
+              str(out)])
+    # Errors while reading are raised in the main thread
+    np.save(obs_dir / 'obs_99.npy', np.zeros(3))
+    with pytest.raises(ValueError):
+        main([str(obs_dir), '--n-obs', '3', '--out', str(out),
+              '--block-bytes', '1000'])
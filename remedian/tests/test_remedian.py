@@ -1,8 +1,21 @@
 """Tests for the Remedian class."""
+import asyncio
+import itertools
+import os
+import pickle
+import tracemalloc
+
 import numpy as np
 import pytest
 
-from remedian.remedian import Remedian
+import remedian.remedian
+from remedian._kernels import (
+    nan_median,
+    network_median,
+    partition_median,
+    weighted_median,
+)
+from remedian.remedian import Remedian, compute_remedian
 
 
 def test_wrong_input():
@@ -117,3 +130,894 @@ def test_true_median():
     remedian_median = r.remedian.squeeze()
     assert true_median.shape == remedian_median.shape
     np.testing.assert_array_equal(true_median, remedian_median)
+
+
+@pytest.mark.parametrize('n_obs, t, n_block', [(3, 10, 4), (2, 17, 5),
+                                               (5, 5, 5), (7, 3, 1),
+                                               (4, 64, 64)])
+def test_add_obs_batch(n_obs, t, n_block):
+    """Test that add_obs_batch equals add_obs in a loop."""
+    obs_size = (2, 3)
+    data = np.random.random(obs_size + (t,))
+
+    r_loop = Remedian(obs_size, n_obs, t)
+    for data_idx in range(t):
+        r_loop.add_obs(data[..., data_idx])
+
+    r_batch = Remedian(obs_size, n_obs, t)
+    for start in range(0, t, n_block):
+        # stack the observations along the first axis this time
+        block = np.moveaxis(data[..., start:start+n_block], -1, 0)
+        r_batch.add_obs_batch(block, axis=0)
+
+    assert r_batch.obs_count == t
+    assert r_batch.obs_idx_counter == r_loop.obs_idx_counter
+    np.testing.assert_array_equal(r_batch.remedian, r_loop.remedian)
+
+    # Wrong observation sizes or too many observations are rejected
+    r = Remedian(obs_size, n_obs, t)
+    with pytest.raises(ValueError):
+        r.add_obs_batch(np.random.random((3, 3, t)))
+    with pytest.raises(RuntimeError):
+        r.add_obs_batch(np.random.random(obs_size + (t+1,)))
+
+
+def test_layout():
+    """Test that both array layouts give the same remedian."""
+    obs_size = (4, 3)
+    n_obs = 3
+    t = 20
+    data = np.random.random(obs_size + (t,))
+
+    r_last = Remedian(obs_size, n_obs, t, layout='last')
+    r_first = Remedian(obs_size, n_obs, t, layout='first')
+    assert r_last.arrs[0].shape == (4, 3, n_obs)
+    assert r_first.arrs[0].shape == (n_obs, 4, 3)
+    for data_idx in range(t):
+        r_last.add_obs(data[..., data_idx])
+        r_first.add_obs(data[..., data_idx])
+    np.testing.assert_array_equal(r_last.remedian, r_first.remedian)
+
+    r_batch = Remedian(obs_size, n_obs, t, layout='first')
+    r_batch.add_obs_batch(data)
+    np.testing.assert_array_equal(r_last.remedian, r_batch.remedian)
+
+    with pytest.raises(ValueError, match='`layout` must be one of'):
+        Remedian(obs_size, n_obs, t, layout='middle')
+
+
+@pytest.mark.parametrize('dtype, median_dtype', [(np.uint8, np.float32),
+                                                 (np.int16, np.float32),
+                                                 (np.int32, np.float64),
+                                                 (np.float32, np.float32),
+                                                 (np.float64, np.float64)])
+def test_dtype(dtype, median_dtype):
+    """Test storing observations in their native data type."""
+    obs_size = (3, 4)
+    n_obs = 4
+    t = 30
+    data = np.random.randint(0, 100, obs_size + (t,)).astype(dtype)
+
+    r = Remedian(obs_size, n_obs, t, dtype=dtype)
+    r_float = Remedian(obs_size, n_obs, t)
+    assert r.arrs[0].dtype == dtype
+    assert all(arr.dtype == median_dtype for arr in r.arrs[1:])
+    for data_idx in range(t):
+        r.add_obs(data[..., data_idx])
+        r_float.add_obs(data[..., data_idx])
+
+    # Medians of integers are exactly representable in the median dtype
+    assert r.remedian.dtype == median_dtype
+    np.testing.assert_array_equal(r.remedian, r_float.remedian)
+
+    # Infer the data type from the first observation
+    r = Remedian(obs_size, n_obs, t, dtype=None)
+    assert r.dtype is None
+    r.add_obs_batch(data)
+    assert r.dtype == dtype
+    assert r.median_dtype == median_dtype
+    np.testing.assert_array_equal(r.remedian, r_float.remedian)
+
+    # Also for many arrays, each of which adds a fractional bit
+    data = np.random.randint(0, 100, (3, 2**12)).astype(dtype)
+    np.testing.assert_array_equal(compute_remedian(data, 2),
+                                  compute_remedian(data.astype(float), 2))
+
+
+@pytest.mark.parametrize('kernel', ['network', 'partition', 'numpy', 'auto'])
+@pytest.mark.parametrize('layout', ['last', 'first'])
+@pytest.mark.parametrize('dtype', [np.float64, np.float16, np.int16])
+def test_kernels(kernel, layout, dtype):
+    """Test that all median kernels give the same remedian."""
+    obs_size = (3, 5)
+    t = 100
+    data = (np.random.random(obs_size + (t,)) * 100).astype(dtype)
+    if dtype == np.float64:
+        data[0, 0, 42] = np.nan
+    for n_obs in [2, 3, 4, 9, 12]:
+        r = Remedian(obs_size, n_obs, t, layout=layout, dtype=dtype,
+                     kernel=kernel)
+        r_np = Remedian(obs_size, n_obs, t, dtype=dtype, kernel='numpy')
+        r.add_obs_batch(data)
+        r_np.add_obs_batch(data)
+        assert r.remedian.dtype == r_np.remedian.dtype
+        np.testing.assert_array_equal(r.remedian, r_np.remedian)
+    if dtype == np.float64:
+        assert np.isnan(r.remedian[0, 0])
+
+    with pytest.raises(ValueError, match='`kernel` must be'):
+        Remedian(obs_size, 3, t, kernel='unknown')
+
+    # The network only for observations with many elements
+    assert Remedian((1,), 9, None)._kernels[0] is partition_median
+    assert Remedian((64, 64), 9, None)._kernels[0] is network_median
+    assert Remedian((16, 16), 9, None, layout='first')._kernels[0] is \
+        network_median
+
+
+@pytest.mark.parametrize('n', range(1, 13))
+def test_median_network(n):
+    """Test the min/max networks with all inputs of zeros and ones."""
+    # By the 0-1 principle, a comparator network selects the median of all
+    # inputs if it does so for all inputs of zeros and ones
+    data = np.array(list(itertools.product([0., 1.], repeat=n))).T
+    np.testing.assert_array_equal(network_median(data.copy(), axis=0),
+                                  np.median(data, axis=0))
+
+
+def test_unbounded():
+    """Test adding an unknown number of observations with t=None."""
+    obs_size = (2, 3)
+    n_obs = 3
+    t = 27
+    data = np.random.random(obs_size + (t + 5,))
+
+    r = Remedian(obs_size, n_obs, None)
+    assert r.k_arrs == 1
+    with pytest.raises(RuntimeError, match='Cannot estimate'):
+        r.estimate()
+
+    # Arrays are added lazily
+    r.add_obs_batch(data[..., :4])
+    assert r.k_arrs == 2
+    assert r.obs_idx_counter == [1, 1]
+
+    # The median of the first n_obs observations outweighs the next
+    # observation in the estimate
+    first = np.median(data[..., :3], axis=-1)
+    np.testing.assert_array_equal(r.estimate(), first)
+
+    # Polling the estimate does not change the state
+    for data_idx in range(4, t):
+        r.add_obs(data[..., data_idx])
+        r.estimate()
+    assert r.k_arrs == 4
+    assert r.remedian is None
+
+    # For a power of n_obs, the estimate is the bounded remedian
+    r_bounded = Remedian(obs_size, n_obs, t)
+    r_bounded.add_obs_batch(data[..., :t])
+    np.testing.assert_array_equal(r.estimate(), r_bounded.remedian)
+
+    # Finalizing stops the ingestion
+    r.add_obs_batch(data[..., t:])
+    remedian = r.finalize()
+    assert r.t == t + 5
+    np.testing.assert_array_equal(remedian, r.remedian)
+    with pytest.raises(RuntimeError):
+        r.add_obs(data[..., 0])
+
+
+def test_weighted_median():
+    """Test the weighted median of the filled parts of all arrays."""
+    # Equal weights give the median
+    values = np.random.random((4, 10))
+    np.testing.assert_array_equal(
+        weighted_median(values, np.ones(10, dtype=int)),
+        np.median(values, axis=-1))
+
+    # Integer weights equal repeating the values
+    weights = np.random.randint(0, 5, 10)
+    weights[0] = 1
+    np.testing.assert_array_equal(
+        weighted_median(values, weights),
+        np.median(np.repeat(values, weights, axis=-1), axis=-1))
+
+    # t is not a power of n_obs: With n_obs=3 and t=14, one value of weight
+    # 9 is in the third array, one value of weight 3 in the second array, and
+    # two observations are in the first array
+    obs_size = (2,)
+    n_obs = 3
+    t = 14
+    data = np.random.random(obs_size + (t,))
+    r = Remedian(obs_size, n_obs, t)
+    r.add_obs_batch(data)
+    assert r.obs_idx_counter == [2, 1, 1]
+    values = np.stack([
+        data[..., 12], data[..., 13],
+        np.median(data[..., 9:12], axis=-1),
+        np.median(np.median(data[..., :9].reshape(2, 3, 3), axis=-1),
+                  axis=-1)], axis=-1)
+    expected = np.median(np.repeat(values, [1, 1, 3, 9], axis=-1), axis=-1)
+    np.testing.assert_array_equal(r.remedian, expected)
+
+
+def test_merge():
+    """Test merging Remedian objects computed on parts of the data."""
+    obs_size = (2, 3)
+    n_obs = 3
+    t = 27
+    data = np.random.random(obs_size + (t,))
+    r = Remedian(obs_size, n_obs, t)
+    r.add_obs_batch(data)
+
+    # Parts aligned with the arrays give exactly the same remedian
+    parts = []
+    for start in range(0, t, 9):
+        part = Remedian(obs_size, n_obs, 9)
+        part.add_obs_batch(data[..., start:start+9])
+        parts.append(part)
+    combined = Remedian.combine(parts)
+    assert combined.t == t
+    np.testing.assert_array_equal(combined.remedian, r.remedian)
+
+    # Any parts give a valid state that can take more observations
+    part1 = Remedian(obs_size, n_obs, None)
+    part1.add_obs_batch(data[..., :10])
+    part2 = Remedian(obs_size, n_obs, None)
+    part2.add_obs_batch(data[..., 10:24])
+    part1.merge(part2)
+    assert part1.obs_count == 24
+    # 24 = 2 * 9 + 2 * 3 + 0 * 1
+    assert part1.obs_idx_counter == [0, 2, 2]
+    part1.add_obs_batch(data[..., 24:])
+    assert part1.obs_idx_counter == [0, 0, 0, 1]
+    assert part2.obs_count == 14
+
+    # Incompatible objects cannot be merged
+    with pytest.raises(ValueError, match='different `n_obs`'):
+        r.merge(Remedian(obs_size, 4, t))
+    with pytest.raises(RuntimeError, match='Cannot merge'):
+        Remedian(obs_size, n_obs, 20).merge(r)
+
+
+def test_pickle():
+    """Test that pickling stores only the filled parts of the arrays."""
+    obs_size = (50, 50)
+    n_obs = 10
+    data = np.random.random(obs_size + (12,))
+    r = Remedian(obs_size, n_obs, 100, layout='first')
+    r.add_obs_batch(data)
+
+    r_pickled = pickle.loads(pickle.dumps(r))
+    assert len(pickle.dumps(r)) < r.arrs[0].nbytes / 2
+    assert r_pickled.obs_idx_counter == r.obs_idx_counter
+    for arr, arr_pickled in zip(r.arrs, r_pickled.arrs):
+        assert arr.shape == arr_pickled.shape
+    np.testing.assert_array_equal(r_pickled.estimate(), r.estimate())
+
+
+@pytest.mark.parametrize('layout', ['last', 'first'])
+def test_n_jobs(layout, monkeypatch):
+    """Test that collapsing on several threads gives the same results."""
+    # Use small tiles to get many tiles
+    monkeypatch.setattr(remedian.remedian, 'TILE_BYTES', 280)
+    obs_size = (10, 7)
+    n_obs = 5
+    t = 60
+    data = np.random.random(obs_size + (t,))
+    data[3, 4, 7] = np.nan
+    for kwargs in ({}, {'quantiles': [0.2, 0.5]}, {'nan_policy': 'omit'}):
+        r = Remedian(obs_size, n_obs, t, layout=layout, **kwargs)
+        for data_idx in range(t):
+            r.add_obs(data[..., data_idx])
+        r_jobs = Remedian(obs_size, n_obs, t, layout=layout, n_jobs=3,
+                          **kwargs)
+        assert len(r_jobs._tiles(n_obs, 8)) == 10
+        # Also the groups collapsed at once are split into tiles
+        r_jobs.add_obs_batch(data)
+        assert r_jobs._executor is not None
+        np.testing.assert_array_equal(r_jobs.remedian, r.remedian)
+    assert pickle.loads(pickle.dumps(r_jobs)).n_jobs == 3
+    assert Remedian(obs_size, n_obs, t, n_jobs=-1).n_jobs >= 1
+    for n_jobs in (0, -2):
+        with pytest.raises(ValueError, match='`n_jobs` must be'):
+            Remedian(obs_size, n_obs, t, n_jobs=n_jobs)
+
+
+@pytest.mark.parametrize('spill_from', [0, 1])
+def test_spill(spill_from, tmp_path):
+    """Test storing arrays in memory-mapped files."""
+    obs_size = (20, 10)
+    n_obs = 4
+    t = 50
+    data = np.random.random(obs_size + (t,))
+    r = Remedian(obs_size, n_obs, t)
+    r.add_obs_batch(data)
+
+    r_spill = Remedian(obs_size, n_obs, t, spill_dir=tmp_path,
+                       spill_from=spill_from, block_bytes=100)
+    assert r_spill.k_arrs == 3
+    for arr_i, arr in enumerate(r_spill.arrs):
+        assert isinstance(arr, np.memmap) == (arr_i >= spill_from)
+    assert len(r_spill._tiles(n_obs, 8)) == 67
+    r_spill.add_obs_batch(data)
+    np.testing.assert_array_equal(r_spill.remedian, r.remedian)
+
+    # Unpickled objects are memory-mapped as well
+    r_pickled = pickle.loads(pickle.dumps(r_spill))
+    assert isinstance(r_pickled.arrs[-1], np.memmap)
+
+
+@pytest.mark.parametrize('t', [40, None])
+def test_save_load(t, tmp_path):
+    """Test saving and resuming a Remedian."""
+    obs_size = (3, 4)
+    n_obs = 3
+    data = np.random.random(obs_size + (40,)).astype(np.float32)
+    r = Remedian(obs_size, n_obs, t, dtype=np.float32, layout='first')
+    r.add_obs_batch(data)
+
+    fname = tmp_path / 'remedian'
+    r_half = Remedian(obs_size, n_obs, t, dtype=np.float32, layout='first')
+    r_half.add_obs_batch(data[..., :22])
+    r_half.save(fname)
+    # Saving again replaces the old state
+    r_half.save(fname)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['remedian']
+
+    for mmap_mode in [None, 'r']:
+        r_loaded = Remedian.load(fname, mmap_mode=mmap_mode)
+        assert r_loaded.obs_idx_counter == r_half.obs_idx_counter
+        assert r_loaded.layout == 'first'
+        assert r_loaded.dtype == np.float32
+        r_loaded.add_obs_batch(data[..., 22:])
+        np.testing.assert_array_equal(r_loaded.estimate(), r.estimate())
+
+    # Saving was interrupted after moving the old state aside
+    os.replace(fname, tmp_path / 'remedian.old')
+    r_loaded = Remedian.load(fname)
+    assert r_loaded.obs_idx_counter == r_half.obs_idx_counter
+    r_half.save(fname)
+    (tmp_path / 'remedian.old').mkdir()
+    (tmp_path / 'remedian.old' / 'stale.npy').touch()
+    r_half.save(fname)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['remedian']
+
+    # A callable kernel has to be passed again
+    r_half.kernel = np.median
+    r_half.save(fname)
+    with pytest.raises(ValueError, match='callable kernel'):
+        Remedian.load(fname)
+    assert Remedian.load(fname, kernel=np.median).kernel is np.median
+
+    # NumPy integers, and no arrays before the data type is inferred
+    r_empty = Remedian(np.array(obs_size), np.int64(n_obs),
+                       None if t is None else np.int64(t), dtype=None,
+                       layout='first')
+    r_empty.save(fname)
+    r_loaded = Remedian.load(fname)
+    assert r_loaded.dtype is None
+    r_loaded.add_obs_batch(data)
+    np.testing.assert_array_equal(r_loaded.estimate(), r.estimate())
+
+
+def test_checkpoint(tmp_path):
+    """Test saving checkpoints every few observations."""
+    obs_size = (3,)
+    n_obs = 3
+    t = 20
+    data = np.random.random(obs_size + (t,))
+    fname = tmp_path / 'checkpoint'
+    r = Remedian(obs_size, n_obs, t, checkpoint_path=fname,
+                 checkpoint_every=5)
+    for data_idx in range(7):
+        r.add_obs(data[..., data_idx])
+    assert Remedian.load(fname).obs_count == 5
+    r.add_obs_batch(data[..., 7:18])
+    assert Remedian.load(fname).obs_count == 18
+    r.add_obs_batch(data[..., 18:])
+    np.testing.assert_array_equal(Remedian.load(fname).remedian, r.remedian)
+
+    with pytest.raises(ValueError, match='must be passed together'):
+        Remedian(obs_size, n_obs, t, checkpoint_path=fname)
+
+
+@pytest.mark.parametrize('layout', ['last', 'first'])
+@pytest.mark.parametrize('n_obs', [2, 3, 30])
+def test_compute_remedian(layout, n_obs, tmp_path):
+    """Test computing the remedian of an array along an axis."""
+    t = 100
+    data = np.random.random((t, 4, 5))
+    r = Remedian((4, 5), n_obs, t)
+    for data_idx in range(t):
+        r.add_obs(data[data_idx])
+
+    res = compute_remedian(data, n_obs, axis=0, layout=layout)
+    np.testing.assert_array_equal(res, r.remedian)
+
+    # Read a memory-mapped file in small blocks
+    fname = tmp_path / 'data.npy'
+    np.save(fname, data)
+    res = compute_remedian(fname, n_obs, axis=0, read_bytes=500,
+                           block_bytes=100)
+    np.testing.assert_array_equal(res, r.remedian)
+
+
+def test_instrument():
+    """Test measuring where the time is spent."""
+    obs_size = (4, 5)
+    n_obs = 3
+    t = 30
+    data = np.random.random(obs_size + (t,))
+
+    r = Remedian(obs_size, n_obs, t)
+    with pytest.raises(RuntimeError, match='No measurements'):
+        r.stats
+    # Nothing is changed without instrumentation
+    assert 'add_obs' not in vars(r)
+
+    collapses = []
+    r = Remedian(obs_size, n_obs, t,
+                 on_collapse=lambda arr_i, duration: collapses.append(arr_i))
+    r.add_obs_batch(data[..., :10])
+    for data_idx in range(10, t):
+        r.add_obs(data[..., data_idx])
+
+    stats = r.stats
+    assert stats['obs_count'] == t
+    assert stats['collapse_count'] == [10, 3, 1, 0]
+    assert collapses.count(0) == 10
+    assert collapses.count(1) == 3
+    assert collapses.count(2) == 1
+    assert all(stats['collapse_max_time'][i] <= stats['collapse_time'][i]
+               for i in range(r.k_arrs))
+    assert stats['estimate_time'] > 0
+    assert stats['ingest_time'] >= sum(stats['collapse_time'])
+    assert stats['obs_per_sec'] > 0
+    assert stats['resident_bytes'] == [arr.nbytes for arr in r.arrs]
+
+    # Snapshots do not change
+    r.estimate()
+    assert r.stats['estimate_time'] > stats['estimate_time']
+
+    r_uninstrumented = Remedian(obs_size, n_obs, t)
+    r_uninstrumented.add_obs_batch(data)
+    np.testing.assert_array_equal(r.remedian, r_uninstrumented.remedian)
+
+
+def test_plan():
+    """Test choosing n_obs for a memory budget."""
+    obs_size = (10, 10)
+    t = 1000
+
+    # The budget for the exact median gives the median
+    plan = Remedian.plan(obs_size, t, 100 * (t + 1) * 8)
+    assert plan.n_obs == t
+    assert plan.k_arrs == 2
+    assert plan.variance_factor == 1
+
+    # Fewest arrays first, then the largest n_obs that fits
+    for budget in (2 * 10**4, 3 * 10**4, 10**5, 6 * 10**5):
+        plan = Remedian.plan(obs_size, t, budget)
+        assert plan.nbytes <= budget
+        assert Remedian.plan(obs_size, t, plan.nbytes).n_obs == plan.n_obs
+        r = Remedian(obs_size, plan.n_obs, t)
+        assert sum(arr.nbytes for arr in r.arrs) == plan.nbytes
+        assert r.k_arr_sizes == plan.k_arr_sizes
+        bigger = Remedian(obs_size, plan.n_obs + 1, t)
+        assert (bigger.k_arrs > plan.k_arrs or
+                sum(arr.nbytes for arr in bigger.arrs) > budget)
+
+    plan = Remedian.plan(obs_size, t, 2 * 10**4)
+    assert plan.k_arrs == 4
+    assert plan.n_collapses == [t // plan.n_obs, t // plan.n_obs**2,
+                                t // plan.n_obs**3, 0]
+    np.testing.assert_allclose(plan.variance_factor, (np.pi / 2)**2)
+
+    # Observations of a smaller data type allow a larger n_obs
+    assert (Remedian.plan(obs_size, t, 10**5, np.uint8).n_obs >
+            Remedian.plan(obs_size, t, 10**5).n_obs)
+
+    with pytest.raises(ValueError, match='too small'):
+        Remedian.plan(obs_size, t, 1000)
+
+    # A single observation, and a NumPy integer t
+    plan_single = Remedian.plan(obs_size, 1, 10**9)
+    assert plan_single.n_obs == 2
+    assert plan_single.k_arr_sizes == [1]
+    assert plan_single.variance_factor == 1
+    assert Remedian.plan(obs_size, np.int64(t), 10**5) == \
+        Remedian.plan(obs_size, t, 10**5)
+
+    r = Remedian(obs_size, None, t, memory_budget=2 * 10**4)
+    assert r.n_obs == plan.n_obs
+    with pytest.raises(ValueError, match='Exactly one'):
+        Remedian(obs_size, 5, t, memory_budget=10**5)
+    with pytest.raises(ValueError, match='Exactly one'):
+        Remedian(obs_size, None, t)
+    with pytest.raises(ValueError, match='bounded'):
+        Remedian(obs_size, None, None, memory_budget=10**5)
+
+    # The budget covers all memory of the other parameters
+    budget = 10**5
+    data = np.random.random(obs_size + (t,))
+    for kwargs in ({'quantiles': [0.1, 0.5, 0.9]}, {'nan_policy': 'omit'},
+                   {'background': True}):
+        plan = Remedian.plan(obs_size, t, budget, **kwargs)
+        r = Remedian(obs_size, None, t, memory_budget=budget, **kwargs)
+        assert r.n_obs == plan.n_obs
+        for data_idx in range(t):
+            r.add_obs(data[..., data_idx])
+        arrs = r.arrs + (r._n_valid or [])[1:]
+        if r._spare is not None:
+            arrs.append(r._spare)
+        assert sum(arr.nbytes for arr in arrs) == plan.nbytes <= budget
+
+
+def test_n_obs_per_array():
+    """Test a different number of observations for each array."""
+    obs_size = (4, 3)
+    t = 3 * 5 * 5
+    rng = np.random.default_rng(7)
+    data = rng.normal(size=obs_size + (t,))
+
+    r = Remedian(obs_size, [3, 5], t)
+    assert r.k_arr_sizes == [3, 5, 5, 1]
+    assert r.modulos == [3, 15, 75, 375]
+    for data_idx in range(t):
+        r.add_obs(data[..., data_idx])
+
+    # Medians of groups of 3, then of groups of 5 twice
+    expected = np.median(data.reshape(obs_size + (-1, 3)), axis=-1)
+    expected = np.median(expected.reshape(obs_size + (-1, 5)), axis=-1)
+    expected = np.median(expected.reshape(obs_size + (-1, 5)), axis=-1)
+    np.testing.assert_allclose(r.remedian, expected[..., 0])
+
+    # A single number is the same as a sequence with this number, and
+    # batches give the same result as single observations
+    np.testing.assert_array_equal(compute_remedian(data, [5], kernel='numpy'),
+                                  compute_remedian(data, 5, kernel='numpy'))
+    for n_obs, t_sub in (([3, 5], 50), ([4, 2, 6], t), ([2, 7], 1)):
+        r = Remedian(obs_size, n_obs, t_sub)
+        for data_idx in range(t_sub):
+            r.add_obs(data[..., data_idx])
+        np.testing.assert_array_equal(
+            compute_remedian(data[..., :t_sub], n_obs, read_bytes=500),
+            r.remedian)
+
+        # Unbounded
+        r_unbounded = Remedian(obs_size, n_obs, None)
+        r_unbounded.add_obs_batch(data[..., :t_sub])
+        np.testing.assert_array_equal(r_unbounded.finalize(), r.remedian)
+
+    r = Remedian(obs_size, (4, 2, 6), None)
+    r.add_obs_batch(data)
+    assert r.k_arr_sizes == [4, 2, 6, 6]
+    assert r.modulos == [4, 8, 48, 288]
+
+    for n_obs in ([], [3, 1]):
+        with pytest.raises(ValueError, match='does not make sense'):
+            Remedian(obs_size, n_obs, t)
+
+
+@pytest.mark.parametrize('layout', ['last', 'first'])
+def test_quantiles(layout, tmp_path):
+    """Test estimating several quantiles in one pass."""
+    obs_size = (4, 3)
+    t = 100
+    quantiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+    rng = np.random.default_rng(3)
+    data = rng.normal(size=obs_size + (t,))
+
+    # Without any collapse, the quantiles are exact
+    r = Remedian(obs_size, t, t, layout=layout, quantiles=quantiles)
+    r.add_obs_batch(data)
+    np.testing.assert_allclose(r.remedian,
+                               np.quantile(data, quantiles, axis=-1))
+
+    # The medians of the quantiles of groups, weighted by observations
+    n_obs = 9
+    r = Remedian(obs_size, n_obs, t, layout=layout, quantiles=quantiles)
+    for data_idx in range(t):
+        r.add_obs(data[..., data_idx])
+    assert r.remedian.shape == (len(quantiles),) + obs_size
+    assert r.arrs[1].shape == tuple(r._arr_shape(n_obs, 1))
+    groups = data[..., :99].reshape(obs_size + (11, n_obs))
+    group_quantiles = np.quantile(groups, quantiles, axis=-1)
+    arr_2 = np.median(group_quantiles[..., :9], axis=-1)
+    values = np.concatenate([arr_2[..., np.newaxis], group_quantiles[..., 9:],
+                             data[..., 99:][np.newaxis].repeat(5, axis=0)],
+                            axis=-1)
+    np.testing.assert_allclose(
+        r.remedian, weighted_median(values, [81, 9, 9, 1]))
+    assert np.all(np.diff(r.remedian, axis=0) >= 0)
+
+    # The median is the same as without quantiles
+    r_median = Remedian(obs_size, n_obs, 99, layout=layout)
+    r_median.add_obs_batch(data[..., :99])
+    r = Remedian(obs_size, n_obs, 99, layout=layout, quantiles=[0.5])
+    r.add_obs_batch(data[..., :99])
+    np.testing.assert_array_equal(r.remedian[0], r_median.remedian)
+
+    # All ways to add observations give the same result
+    expected = compute_remedian(data, n_obs, layout=layout,
+                                quantiles=quantiles)
+    r = Remedian(obs_size, n_obs, None, layout=layout, quantiles=quantiles,
+                 block_bytes=100)
+    r.add_obs_batch(data[..., :50])
+    r.save(tmp_path / 'rem')
+    r = pickle.loads(pickle.dumps(Remedian.load(tmp_path / 'rem')))
+    for data_idx in range(50, t):
+        r.add_obs(data[..., data_idx])
+    np.testing.assert_array_equal(r.estimate(), expected)
+
+    r_other = Remedian(obs_size, n_obs, None, layout=layout,
+                       quantiles=quantiles)
+    r_other.add_obs_batch(data)
+    combined = Remedian.combine([r, r_other])
+    r.merge(r_other)
+    np.testing.assert_array_equal(combined.estimate(), r.estimate())
+    assert combined.estimate().shape == (len(quantiles),) + obs_size
+
+    with pytest.raises(ValueError, match='different `quantiles`'):
+        r.merge(Remedian(obs_size, n_obs, None, layout=layout))
+    for quantiles in ([], [0.5, 1.5]):
+        with pytest.raises(ValueError, match='between 0 and 1'):
+            Remedian(obs_size, n_obs, t, quantiles=quantiles)
+
+
+@pytest.mark.parametrize('t', [100, None])
+def test_background(t):
+    """Test collapsing arrays on a background thread."""
+    obs_size = (4, 5)
+    n_obs = 4
+    rng = np.random.default_rng(8)
+    data = rng.normal(size=obs_size + (100,))
+
+    r_sync = Remedian(obs_size, n_obs, t)
+    r_background = Remedian(obs_size, n_obs, t, background=True,
+                            block_bytes=40)
+    for data_idx in range(90):
+        r_sync.add_obs(data[..., data_idx])
+        r_background.add_obs(data[..., data_idx])
+        if data_idx % 7 == 0:
+            np.testing.assert_array_equal(r_background.estimate(),
+                                          r_sync.estimate())
+    r_background.flush()
+    assert r_background.obs_idx_counter == r_sync.obs_idx_counter
+    for arr_sync, arr_background, n_filled in zip(
+            r_sync.arrs, r_background.arrs, r_sync.obs_idx_counter):
+        np.testing.assert_array_equal(arr_background[..., :n_filled],
+                                      arr_sync[..., :n_filled])
+
+    # Batches and pickling wait for pending collapses
+    r_sync.add_obs_batch(data[..., 90:95])
+    r_background.add_obs(data[..., 90])
+    r_background.add_obs_batch(data[..., 91:95])
+    r_background = pickle.loads(pickle.dumps(r_background))
+    assert r_background.background
+
+    async def produce():
+        for data_idx in range(95, 100):
+            await r_background.aadd_obs(data[..., data_idx])
+        return await r_background.aresult()
+
+    r_sync.add_obs_batch(data[..., 95:])
+    result = asyncio.run(produce())
+    np.testing.assert_array_equal(result, r_sync.estimate())
+    if t is not None:
+        np.testing.assert_array_equal(r_background.remedian,
+                                      r_sync.remedian)
+
+    # Exceptions of the background thread are raised by flush
+    def failing_kernel(data, axis):
+        raise ZeroDivisionError('kernel failed')
+
+    r = Remedian(obs_size, n_obs, t, background=True, kernel=failing_kernel)
+    r.add_obs_batch(data[..., :3])
+    r.add_obs(data[..., 3])
+    with pytest.raises(ZeroDivisionError, match='kernel failed'):
+        r.flush()
+
+
+def test_summary(tmp_path):
+    """Test computing summary statistics along with the remedian."""
+    obs_size = (3, 4)
+    t = 60
+    rng = np.random.default_rng(9)
+    data = rng.normal(10, 3, size=obs_size + (t,))
+
+    def check(summary, data):
+        np.testing.assert_array_equal(summary.min, data.min(axis=-1))
+        np.testing.assert_array_equal(summary.max, data.max(axis=-1))
+        np.testing.assert_allclose(summary.mean, data.mean(axis=-1))
+        np.testing.assert_allclose(summary.var, data.var(axis=-1))
+        assert summary.count == data.shape[-1]
+
+    r = Remedian(obs_size, 5, t, summary=True)
+    for data_idx in range(25):
+        r.add_obs(data[..., data_idx])
+    check(r.summarize(), data[..., :25])
+    np.testing.assert_array_equal(r.summarize().remedian, r.estimate())
+
+    r.add_obs_batch(data[..., 25:40])
+    r.save(tmp_path / 'rem')
+    r = Remedian.load(tmp_path / 'rem')
+    r.add_obs_batch(data[..., 40:41])
+    for data_idx in range(41, t):
+        r.add_obs(data[..., data_idx])
+    summary = r.summarize()
+    check(summary, data)
+    np.testing.assert_array_equal(summary.remedian, r.remedian)
+
+    # Merging combines the statistics
+    parts = [Remedian(obs_size, 5, 30, summary=True) for _ in range(2)]
+    parts[0].add_obs_batch(data[..., :30])
+    parts[1].add_obs_batch(data[..., 30:])
+    check(Remedian.combine(parts).summarize(), data)
+
+    # Integer observations
+    r = Remedian(obs_size, 5, t, dtype=np.uint8, summary=True)
+    r.add_obs_batch(data.astype(np.uint8))
+    check(r.summarize(), data.astype(np.uint8))
+    assert r.summarize().min.dtype == np.uint8
+
+    with pytest.raises(RuntimeError, match='pass `summary=True`'):
+        Remedian(obs_size, 5, t).summarize()
+
+
+@pytest.mark.parametrize('layout', ['last', 'first'])
+def test_nan_policy(layout, tmp_path):
+    """Test ignoring NaN in the observations."""
+    obs_size = (3, 4)
+    n_obs = 5
+    t = n_obs**2
+    rng = np.random.default_rng(10)
+    data = rng.normal(size=obs_size + (t,))
+
+    # Without NaN, the result is the same as with propagation
+    r = Remedian(obs_size, n_obs, t, layout=layout)
+    r.add_obs_batch(data)
+    r_omit = Remedian(obs_size, n_obs, t, layout=layout, nan_policy='omit')
+    r_omit.add_obs_batch(data)
+    np.testing.assert_array_equal(r_omit.remedian, r.remedian)
+
+    # One element without NaN, one with only NaN, and others with some
+    data[rng.random(data.shape) < 0.3] = np.nan
+    data[0, 0] = rng.normal(size=t)
+    data[0, 1] = np.nan
+    data[1, 1, :7] = np.nan
+    expected = np.full(obs_size, np.nan)
+    for idx in np.ndindex(*obs_size):
+        groups = data[idx].reshape(n_obs, n_obs)
+        n_valid = np.sum(~np.isnan(groups), axis=-1)
+        medians = [np.median(group[~np.isnan(group)]) if n else np.nan
+                   for group, n in zip(groups, n_valid)]
+        if n_valid.sum():
+            expected[idx] = np.median(np.repeat(medians, n_valid))
+
+    for block_bytes in (None, 50):
+        r = Remedian(obs_size, n_obs, t, layout=layout, nan_policy='omit',
+                     block_bytes=block_bytes)
+        for data_idx in range(t):
+            r.add_obs(data[..., data_idx])
+        np.testing.assert_array_equal(r.remedian, expected)
+    np.testing.assert_array_equal(
+        compute_remedian(data, n_obs, layout=layout, nan_policy='omit'),
+        expected)
+    assert np.isnan(r.remedian[0, 1])
+
+    # The numbers of valid observations are kept when saving and merging
+    r = Remedian(obs_size, n_obs, None, layout=layout, nan_policy='omit')
+    r.add_obs_batch(data[..., :12])
+    r.save(tmp_path / 'rem')
+    r = Remedian.load(tmp_path / 'rem')
+    r.add_obs_batch(data[..., 12:])
+    np.testing.assert_array_equal(r.finalize(), expected)
+
+    r_parts = []
+    for part in (data[..., :10], data[..., 10:]):
+        r_parts.append(Remedian(obs_size, n_obs, None, layout=layout,
+                                nan_policy='omit'))
+        r_parts[-1].add_obs_batch(part)
+    r = Remedian.combine(r_parts)
+    assert not np.isnan(r.estimate()[1, 1])
+    assert np.isnan(r.estimate()[0, 1])
+
+    # Only the elements with NaN are sorted, the others use the kernel
+    kernel_shapes = []
+
+    def kernel(data, axis):
+        kernel_shapes.append(data.shape)
+        return np.median(data, axis=axis)
+
+    for axis in (0, -1):
+        data = rng.normal(size=(7, 9))
+        data[2, 3] = data[4, 5] = data[5, 3] = np.nan
+        data[:, 8] = np.nan
+        res, n_valid = nan_median(np.array(np.moveaxis(data, 0, axis)), axis,
+                                  kernel)
+        np.testing.assert_array_equal(res[:8], np.nanmedian(data[:, :8], 0))
+        assert np.isnan(res[8])
+        np.testing.assert_array_equal(n_valid, np.sum(~np.isnan(data), 0))
+    assert kernel_shapes == [(6, 7), (6, 7)]
+
+    with pytest.raises(ValueError, match='`nan_policy` must be one of'):
+        Remedian(obs_size, n_obs, t, nan_policy='raise')
+    with pytest.raises(ValueError, match='cannot be combined'):
+        Remedian(obs_size, n_obs, t, nan_policy='omit', quantiles=[0.5])
+
+
+@pytest.mark.parametrize('quantiles', [None, [0.25, 0.5]])
+@pytest.mark.parametrize('t', [10, None])
+def test_reset(t, quantiles):
+    """Test re-using a Remedian and writing the remedian into `out`."""
+    obs_size = [3, 4]
+    shape = obs_size if quantiles is None else [2] + obs_size
+    rng = np.random.default_rng(12)
+    out = np.empty(shape)
+    r = Remedian(obs_size, 3, t, dtype=None, quantiles=quantiles,
+                 summary=True, instrument=True, out=out)
+    arrs = None
+    for n_values in (10, 7):
+        data = rng.normal(size=obs_size + [n_values])
+        r_new = Remedian(obs_size, 3, t, quantiles=quantiles)
+        for r_i in (r, r_new):
+            for data_idx in range(n_values):
+                r_i.add_obs(data[..., data_idx])
+        arrs = arrs or list(r.arrs)
+        np.testing.assert_array_equal(r.estimate(), r_new.estimate())
+        if r.remedian is None:
+            r.finalize()
+        assert r.remedian is out
+        np.testing.assert_array_equal(out, r_new.estimate())
+        assert r.stats['obs_count'] == n_values
+        np.testing.assert_array_equal(r.summarize().max, data.max(axis=-1))
+
+        r.reset()
+        assert r.t == t
+        assert r.obs_count == 0
+        assert r.remedian is None
+        # The inferred data type is kept with the arrays
+        assert r.dtype == np.float64
+        assert all(arr is arr_old for arr, arr_old in zip(r.arrs, arrs))
+        assert sum(r.stats['collapse_count']) == 0
+
+    estimate = np.empty(shape, dtype=np.float32)
+    r.add_obs(np.ones(obs_size))
+    assert r.estimate(out=estimate) is estimate
+    np.testing.assert_array_equal(estimate, 1)
+    with pytest.raises(ValueError, match='Expected `out` of shape'):
+        r.estimate(out=np.empty([5] + obs_size))
+    with pytest.raises(ValueError, match='must be C-contiguous'):
+        r.estimate(out=np.empty(shape[::-1]).T)
+
+
+@pytest.mark.parametrize('layout', ['last', 'first'])
+@pytest.mark.parametrize('kernel', ['network', 'partition'])
+def test_no_allocations(layout, kernel):
+    """Test that adding observations does not allocate any arrays."""
+    n_obs = 5
+    obs = np.random.default_rng(13).normal(size=(64, 64))
+    r = Remedian(obs.shape, n_obs, n_obs**6, layout=layout, kernel=kernel)
+    for _ in range(n_obs**3):
+        r.add_obs(obs)
+    tracemalloc.start()
+    try:
+        # Collapses of all but the last array
+        for _ in range(n_obs**3):
+            r.add_obs(obs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < obs.nbytes / 4
+
+    # The kernels write into `out` without changing the result
+    data = np.random.default_rng(14).normal(size=(4, 6, n_obs))
+    data[0, 0, 2] = np.nan
+    out = np.empty((4, 6))
+    expected = np.median(data, axis=-1)
+    for kernel_func in (network_median, partition_median):
+        kernel_func(data.copy(), -1, out=out)
+        np.testing.assert_array_equal(out, expected)
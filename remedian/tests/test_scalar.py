@@ -0,0 +1,55 @@
+"""Tests for the ScalarRemedian class."""
+import numpy as np
+import pytest
+
+from remedian import Remedian, ScalarRemedian
+
+
+@pytest.mark.parametrize('n_obs', [3, 4, [5, 2]])
+def test_scalar(n_obs):
+    """Test that a ScalarRemedian equals a Remedian of scalars."""
+    rng = np.random.default_rng(5)
+    values = rng.normal(size=500)
+    values[rng.random(500) < 0.1] = 0.5
+
+    rem = Remedian((1,), n_obs, None)
+    scalar = ScalarRemedian(n_obs)
+    start = 0
+    for stop in (1, 2, 40, 41, 300, 350, 500):
+        rem.add_obs_batch(values[np.newaxis, start:stop])
+        chunk = values[start:stop]
+        if stop - start > 10:
+            scalar.add_obs_batch(chunk)
+        else:
+            for value in chunk.tolist():
+                scalar.add_obs(value)
+        assert scalar.obs_count == rem.obs_count
+        assert scalar.k_arrs == rem.k_arrs
+        assert scalar.estimate() == rem.estimate()[0]
+        start = stop
+    assert scalar.finalize() == rem.finalize()[0]
+    assert isinstance(scalar.remedian, float)
+
+    # Any iterable of numbers
+    scalar = ScalarRemedian(n_obs)
+    scalar.add_obs_batch(value for value in values.tolist())
+    assert scalar.estimate() == rem.remedian[0]
+
+
+def test_scalar_nan():
+    """Test that NaN is propagated like in a Remedian."""
+    values = np.arange(30.)
+    values[4] = np.nan
+    for add_batch in (True, False):
+        scalar = ScalarRemedian(3)
+        if add_batch:
+            scalar.add_obs_batch(values)
+        else:
+            for value in values:
+                scalar.add_obs(value)
+        assert np.isnan(scalar.estimate())
+
+    with pytest.raises(RuntimeError, match='before any'):
+        ScalarRemedian(3).estimate()
+    with pytest.raises(ValueError, match='does not make sense'):
+        ScalarRemedian(1)
@@ -0,0 +1,49 @@
+"""Tests for the WindowedRemedian class."""
+import numpy as np
+import pytest
+
+from remedian import WindowedRemedian
+from remedian._kernels import weighted_median
+
+
+def test_window():
+    """Test the remedian over a sliding window."""
+    obs_size = (2, 3)
+    rng = np.random.default_rng(2)
+    data = rng.normal(size=obs_size + (50,))
+
+    # A window that fits into the first array gives the exact median
+    for n_obs, window in ((10, 7), (5, 5)):
+        win = WindowedRemedian(obs_size, n_obs, window)
+        assert win.k_arr_sizes == [window]
+        for data_idx in range(50):
+            win.add_obs(data[..., data_idx])
+            start = max(0, data_idx - window + 1)
+            np.testing.assert_array_equal(
+                win.estimate(),
+                np.median(data[..., start:data_idx+1], axis=-1))
+
+    # Blocks of 9 observations in a ring of 4 blocks
+    win = WindowedRemedian(obs_size, 3, 20)
+    assert win.k_arr_sizes == [3, 3, 4]
+    for data_idx in range(50):
+        win.add_obs(data[..., data_idx])
+    triples = np.median(data[..., :48].reshape(obs_size + (16, 3)), axis=-1)
+    blocks = np.median(triples[..., :15].reshape(obs_size + (5, 3)), axis=-1)
+    # The window starts at observation 30, within the block starting at 27
+    values = np.concatenate([blocks[..., 3:], triples[..., 15:],
+                             data[..., 48:]], axis=-1)
+    expected = weighted_median(values, [6, 9, 3, 1, 1])
+    np.testing.assert_array_equal(win.estimate(), expected)
+
+    # Old observations expire
+    for _ in range(20):
+        win.add_obs(np.full(obs_size, 100.))
+    np.testing.assert_array_equal(win.estimate(), 100.)
+
+    with pytest.raises(ValueError, match='Expected observations of size'):
+        win.add_obs(np.zeros(3))
+    with pytest.raises(ValueError, match='`window` must be at least 1'):
+        WindowedRemedian(obs_size, 3, 0)
+    with pytest.raises(RuntimeError, match='before any'):
+        WindowedRemedian(obs_size, 3, 10).estimate()
@@ -0,0 +1,172 @@
+"""Contains a Remedian over a sliding window of observations."""
+
+# License: MIT
+
+import numpy as np
+
+from remedian._kernels import get_kernel, weighted_median
+from remedian.remedian import _calc_arr_sizes, _level_size, _median_dtype
+
+
+class WindowedRemedian:
+    """Remedian of the most recent observations of an unbounded stream.
+
+    The arrays are set up like for a :class:`Remedian` with ``t=window``,
+    except for the last array: It is a ring of the medians of completed
+    blocks of ``n_obs**(k_arrs - 1)`` observations, in which the median of
+    each new block overwrites the median of the oldest block. The ring holds
+    enough blocks to cover the window at any time.
+
+    Parameters
+    ----------
+    obs_size : ndarray
+        The shape of each observation, see :class:`Remedian`.
+    n_obs : int | sequence of int
+        The number of observations to be stored within each array, see
+        :class:`Remedian`.
+    window : int
+        The number of most recent observations to approximate the median of.
+        If `window` <= `n_obs`, the result is the exact median of the window.
+    dtype : data-type
+        The data type in which the observations are stored, see
+        :class:`Remedian`.
+    kernel : str | callable
+        The median kernel used to collapse full arrays, see
+        :class:`Remedian`.
+
+    Attributes
+    ----------
+    obs_count : int
+        The number of observations added so far.
+    k_arrs : int
+        The number of arrays, including the ring.
+
+    Notes
+    -----
+    :meth:`estimate` takes the weighted median of the values in the filled
+    positions of all arrays like :meth:`Remedian.estimate`. The median of a
+    block in the ring is weighted by the number of its observations that are
+    still within the window, and blocks that are completely outside of the
+    window are ignored. The oldest block can be partly outside of the
+    window, in which case its median approximates the median of its
+    observations within the window.
+
+    """
+
+    def __init__(self, obs_size, n_obs, window, dtype=np.float64,
+                 kernel='auto'):
+        """Initialize the WindowedRemedian object.
+
+        See class docstring for more thorough information.
+
+        Parameters
+        ----------
+        obs_size : ndarray
+            Size of the observations. Must be (1,) for scalars.
+        n_obs : int | sequence of int
+            Observations per array.
+        window : int
+            Number of most recent observations.
+        dtype : data-type
+            Data type of the observations.
+        kernel : str | callable
+            Median kernel used to collapse full arrays.
+
+        """
+        if np.size(n_obs) == 0 or np.min(n_obs) <= 1:
+            raise ValueError('`n_obs` of <= 1 does not make sense.')
+        if window < 1:
+            raise ValueError(f'`window` must be at least 1, but got: {window}')
+        self.obs_size = list(obs_size)
+        self.n_obs = n_obs if np.isscalar(n_obs) else [int(n) for n in n_obs]
+        self.window = window
+        self.dtype = np.dtype(dtype)
+        self.median_dtype = _median_dtype(self.dtype)
+        self.kernel = kernel
+        self.obs_count = 0
+
+        # All but the last array are collapsed as in a Remedian. A window
+        # that fits into the first array is kept as a single ring.
+        if window <= _level_size(self.n_obs, 0):
+            self.k_arr_sizes = [window]
+        else:
+            self.k_arr_sizes = _calc_arr_sizes(self.n_obs, window)
+        self.k_arrs = len(self.k_arr_sizes)
+        self._weights = [int(np.prod(self.k_arr_sizes[:arr_i]))
+                         for arr_i in range(self.k_arrs)]
+        self._block_size = self._weights[-1]
+        if self._block_size > 1:
+            # One more block for the block that is partly outside the window
+            self.k_arr_sizes[-1] += 1
+        self._kernels = [get_kernel(self.kernel, size,
+                                    n_elems=int(np.prod(self.obs_size)))
+                         for size in self.k_arr_sizes[:-1]]
+        dtypes = [self.dtype] + [self.median_dtype] * (self.k_arrs - 1)
+        self.arrs = [np.zeros(self.obs_size + [size], dtype=dtype)
+                     for size, dtype in zip(self.k_arr_sizes, dtypes)]
+        self.obs_idx_counter = [0 for arr in range(self.k_arrs)]
+
+        # The index of the first observation of each block in the ring, and
+        # the position in the ring to put the next block
+        self._ring_starts = np.full(self.k_arr_sizes[-1], -1, dtype=np.int64)
+        self._ring_idx = 0
+
+    def add_obs(self, obs):
+        """Add an observation, which may expire the oldest one.
+
+        Parameters
+        ----------
+        obs : ndarray, shape(obs_size)
+            The observation.
+
+        """
+        obs = np.asanyarray(obs)
+        if list(obs.shape) != self.obs_size:
+            raise ValueError(f'Expected observations of size {self.obs_size} '
+                             f'but received: {list(obs.shape)}')
+        self.obs_count += 1
+        value = obs
+        for arr_i in range(self.k_arrs - 1):
+            obs_idx = self.obs_idx_counter[arr_i]
+            self.arrs[arr_i][..., obs_idx] = value
+            self.obs_idx_counter[arr_i] += 1
+            if self.obs_idx_counter[arr_i] < self.k_arr_sizes[arr_i]:
+                return
+            value = self._kernels[arr_i](self.arrs[arr_i], -1)
+            self.obs_idx_counter[arr_i] = 0
+
+        # A block is complete, overwrite the oldest block in the ring
+        self.arrs[-1][..., self._ring_idx] = value
+        self._ring_starts[self._ring_idx] = self.obs_count - self._block_size
+        self._ring_idx = (self._ring_idx + 1) % self.k_arr_sizes[-1]
+
+    def estimate(self):
+        """Estimate the remedian of the most recent observations.
+
+        Returns
+        -------
+        estimate : ndarray, shape(obs_size)
+            The current approximation of the median of the last `window`
+            observations, or of all observations if there are fewer.
+
+        """
+        if self.obs_count == 0:
+            raise RuntimeError('Cannot estimate the remedian before any '
+                               'observation has been added.')
+
+        # The number of observations of each block within the window
+        window_start = self.obs_count - self.window
+        ring_weights = np.minimum(
+            self._block_size,
+            self._ring_starts + self._block_size - window_start)
+        in_window = (self._ring_starts >= 0) & (ring_weights > 0)
+
+        values = [self.arrs[-1][..., in_window]]
+        weights = [ring_weights[in_window]]
+        for arr, n_filled, weight in zip(self.arrs[:-1], self.obs_idx_counter,
+                                         self._weights):
+            values.append(arr[..., :n_filled])
+            weights.append(np.full(n_filled, weight, dtype=np.int64))
+        values = np.concatenate([value.astype(self.median_dtype, copy=False)
+                                 for value in values], axis=-1)
+        return weighted_median(values, np.concatenate(weights))